@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+'''
+Startup time of manage.py and of the wsgi application.
+Every target runs in a fresh interpreter with python -X importtime (python >= 3.7)
+and reports wall clock time and the top level imports that take the most time.
+
+usage: python benchmarks/importtime.py [top]
+'''
+import os
+import re
+import sys
+import time
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = (
+    ('manage.py help', ['manage.py', 'help']),
+    ('nzgmeet.wsgi', ['-c', 'import nzgmeet.wsgi']),
+)
+
+LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+def run(args):
+    ''' returns wall clock time and list of (cumulative microseconds, module) of top level imports '''
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='nzgmeet.settings')
+    importtime = sys.version_info >= (3, 7)
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + args
+    tic = time.time()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    out, err = process.communicate()
+    seconds = time.time() - tic
+    if process.returncode:
+        raise RuntimeError('{} failed:\n{}'.format(' '.join(args), err))
+    imports = []
+    for line in err.splitlines():
+        match = LINE.match(line)
+        # one space of indentation for top level imports
+        if match and len(match.group(3)) == 1:
+            imports.append((int(match.group(2)), match.group(4)))
+    return seconds, sorted(imports, reverse=True)
+
+def main(top):
+    for name, args in TARGETS:
+        seconds, imports = run(args)
+        print('{}: {:.2f}s'.format(name, seconds))
+        for micros, module in imports[:top]:
+            print('  {:>10.1f} ms  {}'.format(micros / 1000.0, module))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 15)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the time a log call takes in the calling thread:
+a TimedRotatingFileHandler called directly versus nzgmeet.logs.QueueHandler in front of the same handler,
+and a debug call that is discarded by the logger level
+
+usage: python benchmarks/logqueue.py [calls]
+'''
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import timeit
+from logging.handlers import TimedRotatingFileHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nzgmeet.logs import QueueHandler
+
+def filehandler(folder, name):
+    handler = TimedRotatingFileHandler(os.path.join(folder, name), when='D', interval=1, backupCount=0)
+    handler.setFormatter(logging.Formatter('%(levelname)s %(asctime)s %(name)s: %(message)s'))
+    handler.name = name
+    return handler
+
+def logger(name, handler, level=logging.DEBUG):
+    log = logging.getLogger(name)
+    log.handlers = [handler]
+    log.setLevel(level)
+    log.propagate = False
+    return log
+
+def measure(log, method, calls):
+    call = getattr(log, method)
+    seconds = min(timeit.repeat(lambda: call('Added photo %s: %s', 1234, 'IMG_0001.jpg'), number=calls, repeat=3))
+    return seconds / calls * 1e6
+
+def main(calls):
+    folder = tempfile.mkdtemp()
+    try:
+        direct = logger('bench.direct', filehandler(folder, 'direct.log'))
+        target = filehandler(folder, 'queued.log')
+        queued = logger('bench.queued', QueueHandler(handlers=[target]))
+        filtered = logger('bench.filtered', QueueHandler(handlers=[target]), logging.INFO)
+        print('{} calls'.format(calls))
+        print('{:<36} {:>10.2f} us/call'.format('file handler', measure(direct, 'info', calls)))
+        print('{:<36} {:>10.2f} us/call'.format('queue handler', measure(queued, 'info', calls)))
+        print('{:<36} {:>10.2f} us/call'.format('debug call at level INFO', measure(filtered, 'debug', calls)))
+        for handler in queued.handlers + filtered.handlers:
+            handler.close()
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
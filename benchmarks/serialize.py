@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of measurement serialization for the fixeau.com export:
+the per-row dict comprehension that addWaarnemingen used to build versus nzgmeet.fixeau.serialize
+
+usage: python benchmarks/serialize.py [rows]
+'''
+import os
+import sys
+import json
+import random
+import timeit
+from datetime import datetime, timedelta, tzinfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nzgmeet.fixeau import serialize
+
+class UTC(tzinfo):
+    def utcoffset(self, dt):
+        return timedelta(0)
+    def dst(self, dt):
+        return timedelta(0)
+    def tzname(self, dt):
+        return 'UTC'
+
+def generate(count):
+    start = datetime(2015, 6, 1, tzinfo=UTC())
+    dates = [start + timedelta(minutes=15 * i) for i in range(count)]
+    values = [random.choice([random.uniform(0.1, 50), random.uniform(100, 50000)]) for _ in range(count)]
+    return dates, values
+
+def comprehension(dates, values, geometry, source, target):
+    ''' per row serialization as done by addWaarnemingen before columnar serialization '''
+    location = geometry['coordinates']
+    measurements = [{
+        'time': date.isoformat(),
+        # assume units is μS/cm when EC > 50
+        'value': value/1000.0 if value > 50 else value,
+        'location': {
+            'coordinates': [
+                location[0],
+                location[1]
+            ],
+            'type': 'Point'
+        },
+        'meta': {},
+        'source': source,
+        'parameter': 'EC',
+        'unit': 'mS/cm',
+        'series': target} for date, value in zip(dates, values)]
+    return json.dumps(measurements)
+
+def columnar(dates, values, geometry, source, target):
+    return serialize.measurements(dates, values, geometry, source, target, meta=[None] * len(dates))
+
+def main(count):
+    dates, values = generate(count)
+    geometry = {'coordinates': [4.7, 52.9], 'type': 'Point'}
+    args = (dates, values, geometry, 'device-1', 42)
+
+    # both must produce the same payload
+    assert json.loads(comprehension(*args)) == json.loads(columnar(*args))
+
+    repeat = 5
+    print('{} rows, best of {} runs'.format(count, repeat))
+    for name, func in [('comprehension', comprehension), ('columnar', columnar)]:
+        best = min(timeit.repeat(lambda: func(*args), number=1, repeat=repeat))
+        print('{:>14}: {:8.1f} ms {:12.0f} rows/s'.format(name, best * 1000, count / best))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
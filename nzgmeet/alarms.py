@@ -0,0 +1,114 @@
+'''
+Dispatch of alarm mails off the request path
+'''
+import time
+import atexit
+import logging
+import threading
+from collections import namedtuple, OrderedDict
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from django.core.mail import get_connection, EmailMessage
+
+logger = logging.getLogger(__name__)
+
+FROM = 'NZGMeet Alarm <alarm@nzgmeet.nl>'
+SUBJECT = '[NZGMeet] {} alarms'
+
+Alarm = namedtuple('Alarm', 'recipients subject message')
+
+class Dispatcher:
+    ''' Queues alarm mails and sends them from a background thread.
+    Alarms for the same recipient that arrive within window seconds after the first alarm are combined into one mail,
+    and all mails of a window are sent over a single connection of the email backend (default settings.EMAIL_BACKEND).
+    Extra keyword arguments are passed to get_connection. '''
+
+    def __init__(self, window=10, fromaddr=FROM, backend=None, **kwargs):
+        self.window = window
+        self.fromaddr = fromaddr
+        self.backend = backend
+        self.options = kwargs
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stats = {'alarms': 0, 'mails': 0, 'failed': 0}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='alarm dispatcher')
+                self.thread.daemon = True
+                self.thread.start()
+
+    def stop(self):
+        ''' send all queued alarms and stop the background thread '''
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
+
+    def send(self, recipients, subject, message):
+        ''' queue an alarm, returns immediately '''
+        if self.thread is None:
+            self.start()
+        self.queue.put(Alarm(list(recipients), subject, message))
+
+    def compose(self, recipient, alarms):
+        ''' returns a single mail for recipient with all alarms '''
+        if len(alarms) == 1:
+            alarm = alarms[0]
+            return EmailMessage(alarm.subject, alarm.message, self.fromaddr, [recipient])
+        body = '\n\n'.join('{}\n{}'.format(alarm.subject, alarm.message) for alarm in alarms)
+        return EmailMessage(SUBJECT.format(len(alarms)), body, self.fromaddr, [recipient])
+
+    def dispatch(self, alarms):
+        ''' send alarms over one connection, combined per recipient '''
+        byrecipient = OrderedDict()
+        for alarm in alarms:
+            for recipient in alarm.recipients:
+                byrecipient.setdefault(recipient, []).append(alarm)
+        messages = [self.compose(recipient, items) for recipient, items in byrecipient.items()]
+        try:
+            connection = get_connection(self.backend, **self.options)
+            sent = connection.send_messages(messages) or 0
+        except Exception as error:
+            logger.error('Failed to send {} alarm mails: {}'.format(len(messages), error))
+            sent = 0
+        self.stats['alarms'] += len(alarms)
+        self.stats['mails'] += sent
+        self.stats['failed'] += len(messages) - sent
+        logger.debug('Sent {} alarms in {} mails'.format(len(alarms), sent))
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            alarm = self.queue.get()
+            if alarm is None:
+                break
+            alarms = [alarm]
+            deadline = time.time() + self.window
+            while True:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    alarm = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if alarm is None:
+                    # send what we have and stop
+                    stopping = True
+                    break
+                alarms.append(alarm)
+            self.dispatch(alarms)
+
+dispatcher = Dispatcher()
+atexit.register(dispatcher.stop)
+
+def send_alarm(recipients, subject, message):
+    ''' queue an alarm mail on the default dispatcher '''
+    dispatcher.send(recipients, subject, message)
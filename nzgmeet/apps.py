@@ -4,7 +4,22 @@ Created on Jun 16, 2015
 @author: theo
 '''
 from django.apps import AppConfig
+from django.db.models.signals import post_save, post_delete
+
 class IomConfig(AppConfig):
     name = 'iom'
     verbose_name = 'NZG Meet'
-    
\ No newline at end of file
+
+class NzgmeetConfig(AppConfig):
+    name = 'nzgmeet'
+    verbose_name = 'NZG Meet export'
+
+    def ready(self):
+        from acacia.data.models import Project
+        from iom.models import Meetpunt, Waarneming
+        from nzgmeet.cache import project_changed
+        from nzgmeet import geojson
+        for signal in (post_save, post_delete):
+            signal.connect(project_changed, sender=Project, dispatch_uid='nzgmeet.cache.project')
+            signal.connect(geojson.changed, sender=Meetpunt, dispatch_uid='nzgmeet.geojson.meetpunt')
+            signal.connect(geojson.waarneming_changed, sender=Waarneming, dispatch_uid='nzgmeet.geojson.waarneming')
@@ -0,0 +1,36 @@
+'''
+Cached lookups of objects that are read often and rarely change.
+Entries expire after a fixed time and are invalidated when the object is saved or deleted (see NzgmeetConfig.ready).
+Without a shared cache (settings.CACHE_SHARED, redis when REDIS_URL is set) every process has a local memory cache
+and an invalidation only reaches the process that made the change: entries then live at most LOCAL_TIMEOUT seconds.
+'''
+from django.conf import settings
+from django.core.cache import cache
+
+PROJECT_KEY = 'nzgmeet:project'
+PROJECT_TIMEOUT = 3600
+
+# longest time that other processes can see a changed object without a shared cache
+LOCAL_TIMEOUT = 60
+
+def cached(key, timeout, load):
+    ''' returns value of key from the cache, calls load() to get the value when it is not in the cache '''
+    value = cache.get(key)
+    if value is None:
+        value = load()
+        if value is not None:
+            if not getattr(settings, 'CACHE_SHARED', False):
+                timeout = min(timeout, LOCAL_TIMEOUT)
+            cache.set(key, value, timeout)
+    return value
+
+def invalidate(*keys):
+    cache.delete_many(keys)
+
+def get_project():
+    ''' returns the (first) project, cached replacement of Project.objects.first() '''
+    from acacia.data.models import Project
+    return cached(PROJECT_KEY, PROJECT_TIMEOUT, lambda: Project.objects.first())
+
+def project_changed(sender, **kwargs):
+    invalidate(PROJECT_KEY)
@@ -0,0 +1,3 @@
+'''
+Client side support for exporting nzgmeet data to fixeau.com
+'''
@@ -0,0 +1,292 @@
+'''
+REST client for the fixeau.com api
+'''
+import json
+import time
+import zlib
+import base64
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+try:
+    # optional: incremental parsing of large responses
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    # optional: faster json encoder
+    import ujson
+    def dumps(data):
+        return ujson.dumps(data)
+except ImportError:
+    def dumps(data):
+        return json.dumps(data, separators=(',',':'))
+
+logger = logging.getLogger(__name__)
+
+# responses that are worth retrying: rate limiting and server side trouble
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# idempotent methods: retried on RETRY_STATUS and read errors. Other methods (POST, PATCH) are only retried
+# on connection errors and refused requests, when the server has not processed them. A 502 or 504 after a POST may come
+# after the server stored the object, replaying it would create duplicate measurements or series.
+RETRY_METHODS = ('HEAD', 'GET', 'OPTIONS', 'PUT', 'DELETE')
+
+def refused(status, retry_after=False):
+    ''' returns True when a response with status means the server did not process the request:
+    rate limited (429) or unavailable with a Retry-After header (503). Safe to retry for every method '''
+    return status == 429 or (status == 503 and retry_after)
+
+class RetryPolicy(Retry):
+    ''' Retry that also retries POST and PATCH when the request was refused (see refused) '''
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if refused(status_code, has_retry_after):
+            return True
+        return super(RetryPolicy, self).is_retry(method, status_code, has_retry_after)
+
+def retry_policy(total, backoff):
+    ''' returns urllib3 retry policy with exponential backoff (or Retry-After) on connection errors,
+    on refused requests of every method, and on read errors and RETRY_STATUS for RETRY_METHODS '''
+    kwargs = dict(total=total,
+                  backoff_factor=backoff,
+                  status_forcelist=RETRY_STATUS,
+                  # return last response after final attempt, callers will call raise_for_status()
+                  raise_on_status=False)
+    try:
+        return RetryPolicy(allowed_methods=RETRY_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return RetryPolicy(method_whitelist=RETRY_METHODS, **kwargs)
+
+def gzip_compress(data, level=6):
+    ''' returns gzip compressed data '''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+def token_expiry(token):
+    ''' returns expiration time (seconds since epoch) of a JWT or None when token has no (readable) exp claim '''
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload.encode('ascii')).decode('utf-8'))
+        return float(claims['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+def rewind(files):
+    ''' seek files of a multipart request back to the start, so the request can be sent again '''
+    for value in (files or {}).values():
+        f = value[1] if isinstance(value, (tuple, list)) else value
+        if hasattr(f, 'seek'):
+            f.seek(0)
+
+def parse_page(response, page):
+    ''' yields the objects in results of a paginated json response and sets page['next'].
+    With ijson installed, objects are parsed while the response is streamed '''
+    if ijson is None or response.raw is None:
+        json = response.json()
+        page['next'] = json.get('next')
+        for result in json.get('results') or []:
+            yield result
+        return
+    response.raw.decode_content = True
+    try:
+        events = ijson.parse(response.raw, use_float=True)
+    except TypeError:
+        # ijson < 3.1
+        events = ijson.parse(response.raw)
+    builder = None
+    for prefix, event, value in events:
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == 'results.item' and event == 'end_map':
+                yield builder.value
+                builder = None
+        elif prefix == 'results.item' and event == 'start_map':
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif prefix == 'next':
+            page['next'] = value
+
+class Api:
+    ''' Interface to api with JWT authorization.
+    All requests go through keep-alive sessions that share a connection pool of pool_size connections.
+    Every thread gets its own session, so an Api instance can be used by multiple worker threads.
+    timeout is the (connect, read) timeout in seconds for every request,
+    failed requests are retried up to retries times with exponential backoff.
+    transport replaces the http transport adapter (for instance with a StubAdapter for dry runs).
+    Functions in hooks are called with every response.
+    When compress is True, json bodies of at least min_compress bytes are sent gzip compressed. Compression is switched off
+    when the server turns out not to accept it.
+    After login the token is renewed refresh seconds before it expires (halfway for tokens that live shorter), and when a request is refused with 401
+    the client logs in again and replays the request once. Only one thread renews the token, the others wait for it. '''
+
+    def __init__(self, url, pool_size=10, timeout=(10, 120), retries=5, backoff=0.5, transport=None,
+                 compress=True, min_compress=1024, refresh=300):
+        self.url = url
+        self.compress = compress
+        self.min_compress = min_compress
+        # server accepts gzip compressed requests: None = unknown
+        self.gzip = None
+        self.token = None
+        # expiration time of token in seconds since epoch, None = unknown
+        self.expires = None
+        self.refresh = refresh
+        # seconds before expiration that the current token is renewed
+        self.margin = refresh
+        self.credentials = None
+        self.auth_lock = threading.Lock()
+        self.timeout = timeout
+        self.hooks = []
+        # urllib3 connection pools are thread safe, requests sessions are not guaranteed to be
+        self.adapter = transport or HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size,
+                                                max_retries=retry_policy(retries, backoff))
+        self.local = threading.local()
+        self.sessions = []
+        self.lock = threading.Lock()
+
+    @property
+    def session(self):
+        ''' returns the session for the current thread '''
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self.adapter)
+            session.mount('http://', self.adapter)
+            self.local.session = session
+            with self.lock:
+                self.sessions.append(session)
+        return session
+
+    @property
+    def headers(self):
+        return {'Authorization': 'JWT ' + self.token} if self.token else {}
+
+    def request(self, method, path, **kwargs):
+        # prepend self.url to path if required
+        url = path if path.startswith('http') else self.url + path
+        extra = kwargs.pop('headers', {})
+        kwargs.setdefault('timeout', self.timeout)
+        token = self.token
+        if token and self.expires is not None and time.time() >= self.expires - self.margin:
+            try:
+                token = self.renew(token)
+            except requests.RequestException as error:
+                if time.time() >= self.expires:
+                    raise
+                # token is still valid, try again with next request
+                logger.warning('Failed to renew api token: {}'.format(error))
+        response = self.send_request(method, url, token, extra, **kwargs)
+        if response.status_code == 401 and token and self.credentials:
+            # token expired or was revoked: login again and replay the request
+            response.close()
+            token = self.renew(token)
+            rewind(kwargs.get('files'))
+            response = self.send_request(method, url, token, extra, **kwargs)
+        return response
+
+    def send_request(self, method, url, token, extra, **kwargs):
+        headers = {'Authorization': 'JWT ' + token} if token else {}
+        headers.update(extra)
+        return self.session.request(method, url, headers=headers, hooks={'response': self.hooks}, **kwargs)
+
+    def post(self, path, data, **kwargs):
+        return self.send(path, dumps(data), **kwargs)
+
+    def send(self, path, body, **kwargs):
+        ''' post a json encoded body, gzip compressed if possible '''
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.compress and self.gzip is not False and len(body) >= self.min_compress:
+            response = self.request('POST', path, data=gzip_compress(body), 
+                                    headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}, **kwargs)
+            if response.status_code not in (400, 415):
+                if response.ok:
+                    self.gzip = True
+                return response
+            if self.gzip:
+                # compression works, this is a real error
+                return response
+            # try again without compression
+            plain = self.request('POST', path, data=body, headers=headers, **kwargs)
+            if plain.ok:
+                logger.info('Server does not accept gzip compressed requests, compression switched off')
+                self.gzip = False
+            return plain
+        return self.request('POST', path, data=body, headers=headers, **kwargs)
+
+    def put(self, path, id, data):
+        return self.request('PUT', path + str(id) + '/', json=data)
+
+    def patch(self, path, id, data):
+        return self.request('PATCH', path + str(id) + '/', json=data)
+
+    def get(self, path, params=None, **kwargs):
+        return self.request('GET', path, params=params, **kwargs)
+
+    def upload(self, path, data, files):
+        ''' multipart form post (content type is set by requests) '''
+        return self.request('POST', path, data=data, files=files)
+
+    def findObjects(self, path, query=None):
+        ''' returns json iterator of all objects that satisfies query, follows pagination links '''
+        params = query
+        while path:
+            response = self.get(path, params, stream=True)
+            try:
+                response.raise_for_status()
+                page = {}
+                for result in parse_page(response, page):
+                    yield result
+            finally:
+                response.close()
+            path = page.get('next')
+            params = None
+
+    def authenticate(self):
+        ''' obtain a new token with the credentials of the last login (caller holds auth_lock) '''
+        username, password = self.credentials
+        response = self.send_request('POST', self.url + '/token/', None, {}, data={
+            'username': username,
+            'password': password
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        json = response.json()
+        token = json.get('token')
+        self.expires = token_expiry(token)
+        self.token = token
+        if self.expires is not None:
+            lifetime = self.expires - time.time()
+            # djangorestframework-jwt issues tokens of 300 seconds by default: renew those halfway, not before every request
+            self.margin = min(self.refresh, lifetime / 2.0)
+            logger.debug('Api token valid for {:.0f} seconds'.format(lifetime))
+        return token
+
+    def renew(self, token):
+        ''' renew token, unless another thread has done so already. Returns the current token '''
+        with self.auth_lock:
+            if self.token == token:
+                logger.info('Renewing api token')
+                self.authenticate()
+            return self.token
+
+    def login(self, username, password):
+        with self.auth_lock:
+            self.credentials = (username, password)
+            self.token = None
+            self.expires = None
+            return self.authenticate()
+
+    def close(self):
+        with self.lock:
+            sessions, self.sessions = self.sessions, []
+        for session in sessions:
+            session.close()
+        self.adapter.close()
@@ -0,0 +1,70 @@
+'''
+In-memory index of remote objects on fixeau.com
+'''
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# query used to fetch all objects of a path
+QUERIES = {
+    '/series/': {'parameter': 'EC'},
+    '/source/': None,
+    '/user/': None,
+    '/group/': None,
+}
+
+# key functions for remote objects. A key function also accepts the query that is used to find a single object
+KEYS = {
+    '/series/': lambda obj: (obj.get('name'), obj.get('source'), obj.get('parameter'), obj.get('category') or ''),
+    '/source/': lambda obj: obj.get('id'),
+    '/user/': lambda obj: obj.get('username'),
+    '/group/': lambda obj: obj.get('name'),
+}
+
+class Catalog:
+    ''' Answers lookups of series, sources, users and groups locally.
+    All objects of a path are fetched with a single paginated query on the first lookup,
+    objects that are created afterwards must be registered with add(). Safe for use by multiple threads. '''
+
+    def __init__(self, api):
+        self.api = api
+        self.lock = threading.Lock()
+        self.index = {}
+
+    def indexes(self, path):
+        return path in KEYS
+
+    def load(self, path):
+        ''' fetch all objects for path and build index. Returns index '''
+        key = KEYS[path]
+        index = {}
+        for obj in self.api.findObjects(path, QUERIES[path]):
+            index[key(obj)] = obj
+        logger.debug('Prefetched {} objects from {}'.format(len(index), path))
+        return index
+
+    def getIndex(self, path):
+        with self.lock:
+            index = self.index.get(path)
+            if index is None:
+                index = self.index[path] = self.load(path)
+            return index
+
+    def find(self, path, query):
+        ''' returns object for path that matches query or None when not found '''
+        return self.getIndex(path).get(KEYS[path](query))
+
+    def add(self, path, obj):
+        ''' add a new object to the index of path '''
+        index = self.getIndex(path)
+        with self.lock:
+            index[KEYS[path](obj)] = obj
+
+    def invalidate(self, path=None):
+        ''' drop index of path (or all indexes) so it is fetched again on next lookup '''
+        with self.lock:
+            if path:
+                self.index.pop(path, None)
+            else:
+                self.index.clear()
@@ -0,0 +1,79 @@
+'''
+Checkpoint journal for resumable exports to fixeau.com
+'''
+import logging
+import threading
+
+from django.utils import timezone
+
+from nzgmeet.models import ExportRun, ExportStep
+
+logger = logging.getLogger(__name__)
+
+class Journal:
+    ''' Records every completed step of an export run in ExportStep.
+    Every step is committed as soon as it is recorded, so a run that is aborted can be resumed
+    from the first incomplete step. Safe for use by multiple threads.
+    When persist is False, steps are only recorded in memory (for dry runs). '''
+
+    def __init__(self, run, persist=True):
+        self.run = run
+        self.persist = persist
+        self.lock = threading.Lock()
+        self.steps = set()
+        # last completed batch (with datum and waarneming of last row) by (meetpunt, category)
+        self.positions = {}
+        self.batches = {}
+        for step in run.exportstep_set.order_by('pk') if run.pk else []:
+            self.steps.add((step.step, step.meetpunt_id, step.category))
+            if step.step == ExportStep.BATCH:
+                key = (step.meetpunt_id, step.category)
+                self.positions[key] = step
+                self.batches[key] = step.batch
+
+    @classmethod
+    def start(cls, url, full=False, persist=True, resample=''):
+        ''' start journal for a new run '''
+        run = ExportRun(url=url, full=full, resample=resample)
+        if persist:
+            run.save()
+        return cls(run, persist)
+
+    @classmethod
+    def resume(cls, url, persist=True):
+        ''' returns journal of the last unfinished run for url or None when there is none '''
+        run = ExportRun.objects.filter(url=url, finished__isnull=True).order_by('-started').first()
+        if run is None:
+            return None
+        journal = cls(run, persist)
+        logger.info('Resuming export of {}: {} steps completed'.format(run.started, run.exportstep_set.count()))
+        return journal
+
+    def done(self, step, meetpunt=None, category=''):
+        ''' returns True when step has been completed '''
+        return (step, meetpunt, category) in self.steps
+
+    def completed(self):
+        ''' returns set of ids of meetpunten that have been exported completely '''
+        return set(meetpunt for step, meetpunt, category in self.steps if step == ExportStep.MEETPUNT)
+
+    def record(self, step, meetpunt=None, category='', **kwargs):
+        entry = ExportStep(run=self.run, step=step, meetpunt_id=meetpunt, category=category, **kwargs)
+        if self.persist:
+            entry.save()
+        with self.lock:
+            self.steps.add((step, meetpunt, category))
+        return entry
+
+    def batch(self, meetpunt, category, series, row):
+        ''' record completed batch of a series, row is the last waarneming of the batch '''
+        key = (meetpunt, category)
+        with self.lock:
+            number = self.batches[key] = self.batches.get(key, 0) + 1
+        self.positions[key] = self.record(ExportStep.BATCH, meetpunt, category,
+                                          series=series, batch=number, datum=row.datum, waarneming=row.pk)
+
+    def finish(self):
+        self.run.finished = timezone.now()
+        if self.persist:
+            self.run.save(update_fields=['finished'])
@@ -0,0 +1,148 @@
+'''
+Concurrent upload of photos to fixeau.com
+'''
+import os
+import hashlib
+import logging
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from nzgmeet.models import PhotoSync
+
+logger = logging.getLogger(__name__)
+
+def filehash(path, blocksize=1<<16):
+    ''' returns sha1 hex digest of the contents of file path '''
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+class PhotoUploader:
+    ''' Uploads photos to fixeau.com with a pool of worker threads fed by a bounded queue.
+    A photo is identified by the sha1 hash of its content and is never uploaded twice.
+    Uploaded photos are stored in PhotoSync, so next runs skip photos that are already on the server.
+    When persist is False, uploaded photos are only remembered in memory (for dry runs).
+    When derivatives (nzgmeet.images.Derivatives) is given, downscaled copies are uploaded instead of the originals. '''
+
+    def __init__(self, api, workers=4, queue_size=32, persist=True, derivatives=None):
+        self.api = api
+        self.derivatives = derivatives
+        self.workers = workers
+        self.queue_size = queue_size
+        self.persist = persist
+        self.paths = {}
+        self.hashes = {}
+        for photo in PhotoSync.objects.filter(url=api.url):
+            self.paths[photo.path] = photo
+            self.hashes[photo.sha1] = photo
+
+    def get(self, path):
+        ''' returns PhotoSync for file path or None when photo is not on the server '''
+        return self.paths.get(path)
+
+    def send(self, path, source=None):
+        ''' upload a single image, named after source (default path). Returns json of created photo '''
+        filename = os.path.basename(source or path)
+        if os.path.splitext(path)[1] != os.path.splitext(filename)[1]:
+            filename = os.path.splitext(filename)[0] + os.path.splitext(path)[1]
+        with open(path,'rb') as f:
+            payload = {'name': filename}
+            files = {'image':(filename, f)}
+            response = self.api.upload('/photo/', payload, files)
+            response.raise_for_status()
+            return response.json()
+
+    def work(self, tasks, results):
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            sha1, path = task
+            try:
+                upload = self.derivatives.get(path, sha1) if self.derivatives else path
+                sizes = (os.path.getsize(path), os.path.getsize(upload))
+                results.put((sha1, path, self.send(upload, path), sizes, None))
+            except Exception as error:
+                results.put((sha1, path, None, None, error))
+
+    def save(self, path, stat, sha1, photo, image):
+        values = {
+            'size': stat.st_size,
+            'mtime': int(stat.st_mtime),
+            'sha1': sha1,
+            'photo': photo,
+            'image': image}
+        if self.persist:
+            sync, created = PhotoSync.objects.update_or_create(url=self.api.url, path=path, defaults=values)
+        else:
+            sync = PhotoSync(url=self.api.url, path=path, **values)
+        self.paths[path] = sync
+        self.hashes[sha1] = sync
+
+    def collect(self, results, waiting, stats):
+        ''' process results of finished uploads (in the calling thread) '''
+        while True:
+            try:
+                sha1, path, photo, sizes, error = results.get_nowait()
+            except queue.Empty:
+                return
+            files = waiting.pop(sha1)
+            if error is not None:
+                logger.error('Failed to upload photo {}: {}'.format(path, error))
+                stats['failed'] += len(files)
+                continue
+            logger.debug('Added photo {}: {}'.format(photo['id'],photo['name']))
+            stats['uploaded'] += 1
+            stats['original_bytes'] += sizes[0]
+            stats['sent_bytes'] += sizes[1]
+            for path, stat in files:
+                self.save(path, stat, sha1, photo['id'], photo['image'])
+
+    def upload(self, paths):
+        ''' upload all photos in paths that are not on the server yet.
+        Returns dict with statistics, including the size of the uploaded photos before and after preprocessing '''
+        stats = {'uploaded': 0, 'skipped': 0, 'failed': 0, 'original_bytes': 0, 'sent_bytes': 0}
+        tasks = queue.Queue(self.queue_size)
+        results = queue.Queue()
+        # files waiting for upload by content hash
+        waiting = {}
+        threads = [threading.Thread(target=self.work, args=(tasks, results)) for _ in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                    known = self.paths.get(path)
+                    if known and known.size == stat.st_size and known.mtime == int(stat.st_mtime):
+                        stats['skipped'] += 1
+                        continue
+                    sha1 = filehash(path)
+                except (IOError, OSError) as error:
+                    logger.warning('Photo {} not available: {}'.format(path, error))
+                    stats['failed'] += 1
+                    continue
+                known = self.hashes.get(sha1)
+                if known:
+                    # same content has been uploaded before under another name
+                    self.save(path, stat, sha1, known.photo, known.image)
+                    stats['skipped'] += 1
+                elif sha1 in waiting:
+                    waiting[sha1].append((path, stat))
+                else:
+                    waiting[sha1] = [(path, stat)]
+                    tasks.put((sha1, path))
+                self.collect(results, waiting, stats)
+        finally:
+            for thread in threads:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+        self.collect(results, waiting, stats)
+        return stats
@@ -0,0 +1,104 @@
+'''
+Timing and request statistics of an export to fixeau.com
+'''
+import time
+import heapq
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+class Profile:
+    ''' Collects time per phase, request counts and payload sizes per endpoint and the slowest meetpunten.
+    Safe for use by multiple threads: times of phases are summed over all threads. '''
+
+    def __init__(self, url, slowest=10):
+        self.base = urlparse(url).path.rstrip('/')
+        self.slowest = slowest
+        self.lock = threading.Lock()
+        # name -> [count, seconds]
+        self.phases = defaultdict(lambda: [0, 0.0])
+        # (method, endpoint) -> [count, bytes sent, bytes received, seconds]
+        self.endpoints = defaultdict(lambda: [0, 0, 0, 0.0])
+        # heap of (seconds, meetpunt)
+        self.meetpunten = []
+        self.start = time.time()
+
+    def add(self, name, seconds, count=1):
+        with self.lock:
+            phase = self.phases[name]
+            phase[0] += count
+            phase[1] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        ''' time a block of code as phase name '''
+        tic = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - tic)
+
+    def timed(self, name, iterable):
+        ''' iterate over iterable, adding the time spent waiting for items to phase name '''
+        iterator = iter(iterable)
+        seconds = 0.0
+        count = 0
+        try:
+            while True:
+                tic = time.time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    seconds += time.time() - tic
+                count += 1
+                yield item
+        finally:
+            self.add(name, seconds, count)
+
+    def endpoint(self, url):
+        ''' returns endpoint of url relative to api url, object ids replaced by {id} '''
+        path = urlparse(url).path
+        if path.startswith(self.base):
+            path = path[len(self.base):]
+        segments = [s for s in path.split('/') if s]
+        return '/' + '/'.join(segments[:1] + ['{id}'] * len(segments[1:])) + '/'
+
+    def response(self, response, *args, **kwargs):
+        ''' requests response hook '''
+        request = response.request
+        body = request.body or b''
+        key = (request.method, self.endpoint(request.url))
+        with self.lock:
+            stats = self.endpoints[key]
+            stats[0] += 1
+            stats[1] += len(body)
+            stats[2] += int(response.headers.get('Content-Length') or 0)
+            stats[3] += response.elapsed.total_seconds()
+        return response
+
+    def meetpunt(self, name, seconds):
+        with self.lock:
+            item = (seconds, name)
+            if len(self.meetpunten) < self.slowest:
+                heapq.heappush(self.meetpunten, item)
+            else:
+                heapq.heappushpop(self.meetpunten, item)
+
+    def report(self, log):
+        ''' write report with function log (for instance logger.info) '''
+        log('Profile of export, {:.1f}s wall clock'.format(time.time() - self.start))
+        log('{:<24} {:>8} {:>10}'.format('phase', 'count', 'seconds'))
+        for name, (count, seconds) in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+            log('{:<24} {:>8} {:>10.2f}'.format(name, count, seconds))
+        log('{:<32} {:>8} {:>12} {:>12} {:>10}'.format('request', 'count', 'sent', 'received', 'seconds'))
+        for (method, endpoint), (count, sent, received, seconds) in sorted(self.endpoints.items()):
+            log('{:<32} {:>8} {:>12} {:>12} {:>10.2f}'.format(method + ' ' + endpoint, count, sent, received, seconds))
+        log('Slowest meetpunten:')
+        for seconds, name in sorted(self.meetpunten, reverse=True):
+            log('{:>10.2f}s {}'.format(seconds, name))
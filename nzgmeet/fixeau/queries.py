@@ -0,0 +1,161 @@
+'''
+Database access for the fixeau.com export
+'''
+import logging
+from collections import namedtuple
+from itertools import groupby
+from operator import attrgetter
+
+from django.db.models import Q, Max
+from django.db.models.functions import Lower
+
+from iom.models import Waarneming
+
+logger = logging.getLogger(__name__)
+
+# names of EC waarnemingen by fixeau category
+CATEGORIES = {
+    'Shallow': 'ec_ondiep',
+    'Deep': 'ec_diep',
+    '': 'ec'
+}
+
+# fixeau category by (lower case) name of waarneming
+NAMES = {naam: category for category, naam in CATEGORIES.items()}
+
+# fields of a waarneming that are needed for the export
+Row = namedtuple('Row', ['meetpunt', 'naam', 'datum', 'pk', 'waarde', 'foto_url'])
+
+class ExportQuery:
+    ''' Reads the EC waarnemingen of all meetpunten with a single ordered query and groups them by meetpunt and category.
+    syncs is a dict of SeriesSync by (meetpunt id, category): only waarnemingen after the high-water mark
+    of a series are returned, unless full is True. Rows of a raw series are ordered by primary key and its high-water mark
+    is the pk of the last waarneming that has been exported, so waarnemingen that are added later with an older datum
+    are still exported. A resampled series (resampled is True) is ordered by datum and can not be amended,
+    its mark is (datum, pk) of the last waarneming of the last exported interval.
+    positions is a dict of ExportStep by (meetpunt id, category) with the last batch of an interrupted run,
+    waarnemingen up to that batch are skipped as well.
+    Meetpunten with an id in skip are left out. Time spent in the database is added to phase 'db query' of profile. '''
+
+    def __init__(self, syncs=None, full=False, skip=None, profile=None, positions=None, resampled=False):
+        self.syncs = {} if full or syncs is None else syncs
+        self.positions = positions or {}
+        self.resampled = resampled
+        self.skip = skip or set()
+        self.profile = profile
+
+    def queryset(self):
+        return Waarneming.objects.annotate(lnaam=Lower('naam')).filter(lnaam__in=list(NAMES))
+
+    def mark(self, meetpunt, category):
+        ''' returns high-water mark of a series or None: highest exported pk, or (datum, pk) for resampled series '''
+        sync = self.syncs.get((meetpunt, category))
+        if sync is None or sync.waarneming is None:
+            return None
+        return (sync.datum, sync.waarneming) if self.resampled else sync.waarneming
+
+    def position(self, meetpunt, category):
+        ''' returns position of the last waarneming of the last batch of an interrupted run (as mark()) or None '''
+        step = self.positions.get((meetpunt, category))
+        if step is None or step.waarneming is None:
+            return None
+        return (step.datum, step.waarneming) if self.resampled else step.waarneming
+
+    def bounds(self):
+        ''' returns dict with the lower bound of the waarnemingen to export by meetpunt id, for every meetpunt
+        with new waarnemingen: None when a series of the meetpunt has no mark, otherwise the oldest mark of its series,
+        a pk for raw series or a datum for resampled series. A single aggregate query for all series. '''
+        bounds = {}
+        for series in self.queryset().values('locatie', 'lnaam').annotate(last=Max('datum'), highest=Max('pk')):
+            meetpunt = series['locatie']
+            if meetpunt in self.skip:
+                continue
+            mark = self.mark(meetpunt, NAMES[series['lnaam']])
+            if mark is None:
+                bound = None
+            elif self.resampled:
+                if series['last'] < mark[0]:
+                    continue
+                bound = mark[0]
+            elif series['highest'] > mark:
+                bound = mark
+            else:
+                continue
+            if meetpunt not in bounds:
+                bounds[meetpunt] = bound
+            elif bound is None or bounds[meetpunt] is None:
+                bounds[meetpunt] = None
+            else:
+                bounds[meetpunt] = min(bound, bounds[meetpunt])
+        return bounds
+
+    def since(self, bound):
+        ''' returns Q object for the waarnemingen after lower bound (see bounds) '''
+        return Q(datum__gte=bound) if self.resampled else Q(pk__gt=bound)
+
+    def filter(self):
+        ''' returns Q object that selects all waarnemingen needed for the export.
+        Rows before the high-water mark of a series can still be selected, these are skipped in rows() '''
+        if not self.syncs:
+            return Q()
+        bounds = self.bounds()
+        marked = [bound for bound in bounds.values() if bound is not None]
+        query = Q(locatie__in=[meetpunt for meetpunt, bound in bounds.items() if bound is None])
+        if marked:
+            query |= self.since(min(marked))
+        return query
+
+    def rows(self, query=None):
+        ''' iterates over all rows for the export ordered by meetpunt, category and pk (datum and pk for resampled series),
+        or over the rows selected by Q object query '''
+        if query is None:
+            if self.profile:
+                with self.profile.phase('db query'):
+                    query = self.filter()
+            else:
+                query = self.filter()
+        order = ('datum', 'pk') if self.resampled else ('pk',)
+        queryset = self.queryset().filter(query).order_by('locatie', 'lnaam', *order)
+        rows = queryset.values_list('locatie', 'lnaam', 'datum', 'pk', 'waarde', 'foto_url').iterator()
+        if self.profile:
+            rows = self.profile.timed('db query', rows)
+        for row in rows:
+            yield Row._make(row)
+
+    def after(self, rows, mark, position=None):
+        ''' skip rows up to and including the high-water mark and the position of an interrupted run '''
+        key = (lambda row: (row.datum, row.pk)) if self.resampled else attrgetter('pk')
+        for row in rows:
+            if mark is not None and key(row) <= mark:
+                continue
+            if position is not None and key(row) <= position:
+                continue
+            yield row
+
+    def meetpunten(self):
+        ''' yields (meetpunt id, series) for every meetpunt with waarnemingen to export.
+        series iterates over (category, rows). Rows are read lazily from the database cursor:
+        consume the series of a meetpunt before advancing to the next meetpunt. '''
+        for meetpunt, rows in groupby(self.rows(), attrgetter('meetpunt')):
+            if meetpunt not in self.skip:
+                yield meetpunt, self.series(meetpunt, rows)
+
+    def separate(self):
+        ''' yields (meetpunt id, series) like meetpunten(), but the rows of every meetpunt are read with a query of its own
+        when its series are consumed, so different threads can consume the series of different meetpunten at the same time.
+        Every thread uses its own database connection. '''
+        if self.profile:
+            with self.profile.phase('db query'):
+                bounds = self.bounds()
+        else:
+            bounds = self.bounds()
+        for meetpunt in sorted(bounds):
+            query = Q(locatie=meetpunt)
+            if bounds[meetpunt] is not None:
+                query &= self.since(bounds[meetpunt])
+            yield meetpunt, self.series(meetpunt, self.rows(query))
+
+    def series(self, meetpunt, rows):
+        for naam, rows in groupby(rows, attrgetter('naam')):
+            category = NAMES[naam]
+            yield category, self.after(rows, self.mark(meetpunt, category), self.position(meetpunt, category))
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+'''
+Downsampling of EC series before export to fixeau.com
+'''
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from nzgmeet.fixeau.serialize import normalize
+
+RULES = ('1H', '1D')
+AGGREGATES = ('mean', 'min', 'max', 'last')
+
+# aggregated value of an interval. datum is the start of the interval, waarde is in mS/cm,
+# last is the last waarneming (Row) in the interval, used as high-water mark
+Bucket = namedtuple('Bucket', ['datum', 'waarde', 'last', 'foto_url'])
+
+def label(rule, how):
+    ''' returns label of a resampling mode, for instance "1H mean" '''
+    return '{} {}'.format(rule, how)
+
+def floor(index, freq, tz):
+    ''' returns start (in UTC) of the intervals of length freq in local time of tz for timezone aware index.
+    Daily intervals start at local midnight, also on days with a change to or from daylight saving time '''
+    local = index.tz_convert(tz)
+    # floor needs to know whether an ambiguous local time (the repeated hour in autumn) is in summer time
+    offsets = (local.tz_localize(None) - index.tz_localize(None)).values
+    unique, first = np.unique(offsets, return_index=True)
+    summer = [offset for offset, position in zip(unique, first) if local[position].dst()]
+    bins = local.floor(freq, ambiguous=np.isin(offsets, summer), nonexistent='shift_backward')
+    # local times in the repeated hour do not compare equal to the same time in other zones
+    return bins.tz_convert('UTC')
+
+def resample(rows, rule, how, now=None, chunk_size=100000, tz=None):
+    ''' yields a Bucket for every interval of length rule that contains rows (ordered by datum, pk).
+    Intervals of timezone aware rows are in local time of tz (default settings.TIME_ZONE),
+    so daily intervals end at local midnight. Values are normalized to mS/cm before they are aggregated with how.
+    The interval of the last row is only returned when it has ended before now (default current time),
+    a later export continues with the rows of that interval.
+    Rows are read in chunks of chunk_size, so the memory needed does not depend on the length of the series '''
+    freq = pd.Timedelta(rule)
+    rows = iter(rows)
+    pending = []
+    while True:
+        chunk = pending + list(islice(rows, chunk_size))
+        final = len(chunk) - len(pending) < chunk_size
+        if not chunk:
+            return
+        dates = [row.datum for row in chunk]
+        aware = getattr(dates[0], 'tzinfo', None) is not None
+        index = pd.to_datetime(dates, utc=aware)
+        bins = floor(index, freq, tz or settings.TIME_ZONE) if aware else index.floor(freq)
+        values = pd.Series(normalize([row.waarde for row in chunk]), index=bins)
+        positions = pd.Series(np.arange(len(chunk)), index=bins)
+        grouped = values.groupby(level=0, sort=False)
+        aggregated = getattr(grouped, how)()
+        ends = positions.groupby(level=0, sort=False).last()
+        count = len(aggregated)
+        if final:
+            if now is None:
+                now = pd.Timestamp.now(tz='UTC') if aware else pd.Timestamp.now()
+            current = pd.Timestamp(now)
+            if aware and current.tzinfo is None:
+                current = current.tz_localize('UTC')
+            if bins[-1] + freq > current:
+                # interval has not ended yet
+                count -= 1
+        else:
+            # rows of the last interval may continue in the next chunk
+            count -= 1
+        for start, value, position in zip(aggregated.index[:count], aggregated.values[:count], ends.values[:count]):
+            yield Bucket(start.to_pydatetime(), value, chunk[position], None)
+        if final:
+            return
+        pending = chunk[ends.values[count - 1] + 1:] if count > 0 else chunk
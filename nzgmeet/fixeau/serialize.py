@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+'''
+Columnar serialization of measurements for the fixeau.com api
+'''
+import json
+
+import numpy as np
+import pandas as pd
+
+def normalize(values):
+    ''' returns EC values in mS/cm. Assume units is μS/cm when EC > 50 '''
+    values = np.asarray(values, dtype=float)
+    return np.where(values > 50, values / 1000.0, values)
+
+def isoformat(dates):
+    ''' returns array with isoformat() strings of a sequence of datetimes,
+    timezone aware datetimes are converted to UTC '''
+    aware = getattr(dates[0], 'tzinfo', None) is not None
+    index = pd.to_datetime(dates, utc=aware)
+    if aware:
+        index = index.tz_localize(None)
+    values = index.values.astype('datetime64[us]')
+    # isoformat() only shows microseconds when there are any
+    unit = 'us' if (index.microsecond != 0).any() else 's'
+    times = np.datetime_as_string(values, unit=unit).astype(object)
+    return times + '+00:00' if aware else times
+
+def numbers(values):
+    ''' returns array with json numbers of float array values, NaN and infinity (not valid in json) are null '''
+    text = np.array([repr(value) for value in values.tolist()], dtype=object)
+    text[~np.isfinite(values)] = 'null'
+    return text
+
+def measurements(dates, values, geometry, source, target, meta=None, convert=True):
+    ''' serialize a batch of measurements to a json list for the /measurement/ endpoint.
+    dates and values are sequences of equal length, meta is an optional sequence of dicts (or None) per measurement.
+    Values are normalized to mS/cm, unless convert is False (values are in mS/cm already). Returns json text '''
+    count = len(dates)
+    if count == 0:
+        return '[]'
+    times = isoformat(dates)
+    values = numbers(normalize(values) if convert else np.asarray(values, dtype=float))
+    if meta is None:
+        fields = ''
+    else:
+        metas = np.array([json.dumps(m) if m else '{}' for m in meta], dtype=object)
+        fields = ',"meta":' + metas
+    # the same for every measurement of the batch: encoded once
+    tail = json.dumps({
+        'location': geometry,
+        'source': source,
+        'parameter': 'EC',
+        'unit': 'mS/cm',
+        'series': target}, separators=(',',':'))[1:]
+    rows = '{"time":"' + times + '","value":' + values + fields + ',' + tail
+    return '[' + ','.join(rows) + ']'
@@ -0,0 +1,78 @@
+'''
+Stand-in for fixeau.com that can be mounted as transport of an Api session, used for dry runs
+'''
+import json
+import zlib
+import itertools
+import threading
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+RESOURCES = ('token', 'series', 'source', 'user', 'group', 'photo', 'measurement')
+
+def decode(request):
+    ''' returns decoded json body of request '''
+    body = request.body
+    if request.headers.get('Content-Encoding') == 'gzip':
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    return json.loads(body) if body else {}
+
+class StubAdapter(BaseAdapter):
+    ''' Answers api requests the way fixeau.com does without network access.
+    Nothing is stored: lookups never find anything, created objects get a new id '''
+
+    def __init__(self):
+        super(StubAdapter, self).__init__()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+    def nextid(self):
+        with self.lock:
+            return next(self.ids)
+
+    def respond(self, request, status, data):
+        response = requests.Response()
+        response.status_code = status
+        response.reason = 'OK' if status < 400 else 'Not Found'
+        response._content = json.dumps(data).encode('utf-8')
+        response.headers = CaseInsensitiveDict({
+            'Content-Type': 'application/json',
+            'Content-Length': str(len(response._content))})
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def send(self, request, **kwargs):
+        segments = [s for s in urlparse(request.url).path.split('/') if s]
+        resource = next((s for s in reversed(segments) if s in RESOURCES), None)
+        detail = segments[-1] != resource
+        if resource is None:
+            return self.respond(request, 404, {'detail': 'Not found.'})
+        if resource == 'token':
+            return self.respond(request, 200, {'token': 'dry-run'})
+        if request.method == 'GET':
+            if detail:
+                return self.respond(request, 404, {'detail': 'Not found.'})
+            return self.respond(request, 200, {'count': 0, 'next': None, 'previous': None, 'results': []})
+        if resource == 'measurement':
+            measurements = decode(request)
+            return self.respond(request, 201, {'count': len(measurements)})
+        pk = self.nextid()
+        if resource == 'photo':
+            return self.respond(request, 201, {'id': pk, 'name': 'photo{}'.format(pk),
+                                               'image': 'https://dry-run/media/photo{}.jpg'.format(pk)})
+        data = decode(request)
+        data.setdefault('id', pk)
+        return self.respond(request, 201, data)
+
+    def close(self):
+        pass
@@ -0,0 +1,28 @@
+'''
+Username assignment for fixeau.com user accounts
+'''
+from itertools import chain, count
+
+def basename(waarnemer):
+    ''' returns preferred username of a waarnemer '''
+    return str(waarnemer).lower().replace(' ', '')
+
+def assign_usernames(waarnemers, existing, claimed):
+    ''' assign usernames to waarnemers without an account.
+    existing is the set of usernames on fixeau.com, claimed the set of usernames that belong to other waarnemers.
+    An existing account with the preferred username that is not claimed belongs to the waarnemer,
+    otherwise the first free username of basename, basename1, basename2, .. is used for a new account.
+    Returns list of (waarnemer, username, exists) '''
+    claimed = set(claimed)
+    result = []
+    for waarnemer in waarnemers:
+        name = basename(waarnemer)
+        if name in existing and name not in claimed:
+            result.append((waarnemer, name, True))
+            username = name
+        else:
+            candidates = chain([name], ('{}{}'.format(name, index) for index in count(1)))
+            username = next(c for c in candidates if c not in existing and c not in claimed)
+            result.append((waarnemer, username, False))
+        claimed.add(username)
+    return result
@@ -0,0 +1,103 @@
+'''
+Precomputed GeoJSON layer of all meetpunten with their latest EC value
+'''
+import json
+import hashlib
+
+from django.contrib.gis.db.models.functions import Transform
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+from django.db.models import Max, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Lower
+
+from iom.models import Meetpunt, Waarneming
+from nzgmeet.cache import cached, invalidate
+from nzgmeet.fixeau.queries import NAMES
+from nzgmeet.fixeau.serialize import normalize
+
+GEOJSON_KEY = 'nzgmeet:meetpunten.geojson'
+# the key is versioned by the highest waarneming id and invalidated when a meetpunt or an existing waarneming changes,
+# the timeout is a safety net and removes the layers of older versions
+GEOJSON_TIMEOUT = 24 * 3600
+
+# geometry field of Meetpunt (MeetLocatie.location)
+GEOMETRY = 'location'
+
+def latest():
+    ''' returns dict of (naam, datum, waarde) of the latest EC waarneming by meetpunt id.
+    A single DISTINCT ON (locatie) query on PostgreSQL, other databases look up the id of the latest waarneming
+    with one subquery per meetpunt and read those waarnemingen with a second query '''
+    waarnemingen = Waarneming.objects.annotate(lnaam=Lower('naam')).filter(lnaam__in=list(NAMES))
+    if connection.vendor == 'postgresql':
+        rows = (waarnemingen.order_by('locatie', '-datum', '-pk')
+                .distinct('locatie')
+                .values_list('locatie', 'lnaam', 'datum', 'waarde'))
+    else:
+        last = waarnemingen.filter(locatie=OuterRef('pk')).order_by('-datum', '-pk').values('pk')[:1]
+        pks = Meetpunt.objects.annotate(last=Subquery(last, output_field=IntegerField())).values_list('last', flat=True)
+        rows = waarnemingen.filter(pk__in=[pk for pk in pks if pk is not None]).values_list('locatie', 'lnaam', 'datum', 'waarde')
+    return {locatie: (naam, datum, waarde) for locatie, naam, datum, waarde in rows}
+
+def build():
+    ''' returns FeatureCollection of all meetpunten in WGS84 with name, category and datum and value (mS/cm) of the latest
+    EC waarneming. The coordinates are transformed by the database '''
+    latest_ec = latest()
+    meetpunten = (Meetpunt.objects
+                  .annotate(wgs84=Transform(GEOMETRY, 4326))
+                  .exclude(**{GEOMETRY + '__isnull': True})
+                  .order_by('pk')
+                  .values_list('pk', 'name', 'wgs84'))
+    rows = [(pk, name, point) + latest_ec.get(pk, (None, None, None)) for pk, name, point in meetpunten]
+    values = normalize([float(row[5]) if row[5] is not None else float('nan') for row in rows])
+    features = []
+    for (pk, name, point, naam, datum, waarde), value in zip(rows, values.tolist()):
+        features.append({
+            'type': 'Feature',
+            'id': pk,
+            'geometry': {'type': 'Point', 'coordinates': [point.x, point.y]},
+            'properties': {
+                'name': name,
+                'category': NAMES.get(naam) if naam else None,
+                'datum': datum.isoformat() if datum else None,
+                'ec': None if waarde is None else value,
+            }
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+def load():
+    text = json.dumps(build(), separators=(',', ':'))
+    return {'etag': hashlib.md5(text.encode('utf-8')).hexdigest(), 'json': text}
+
+def version():
+    ''' returns highest waarneming id: new waarnemingen, also from bulk imports, give the layer a new cache key '''
+    return Waarneming.objects.aggregate(last=Max('pk'))['last'] or 0
+
+def key():
+    return '{}:{}'.format(GEOJSON_KEY, version())
+
+def get_layer():
+    ''' returns dict with json text of the FeatureCollection and its etag, from the cache when possible '''
+    return cached(key(), GEOJSON_TIMEOUT, load)
+
+def get_collection(bbox=None, layer=None):
+    ''' returns FeatureCollection (dict), only meetpunten within bbox (xmin, ymin, xmax, ymax in WGS84) when given.
+    The bounding box is queried with the spatial index of Meetpunt, the features come from layer (default the cached layer) '''
+    collection = json.loads((layer or get_layer())['json'])
+    if bbox is not None:
+        area = Polygon.from_bbox(bbox)
+        area.srid = 4326
+        inside = set(Meetpunt.objects.filter(**{GEOMETRY + '__bboverlaps': area}).values_list('pk', flat=True))
+        collection['features'] = [f for f in collection['features'] if f['id'] in inside]
+    return collection
+
+def locations():
+    ''' returns dict of geojson point geometry by meetpunt id '''
+    return {f['id']: f['geometry'] for f in json.loads(get_layer()['json'])['features']}
+
+def changed(sender, **kwargs):
+    invalidate(key())
+
+def waarneming_changed(sender, created=False, **kwargs):
+    ''' a new waarneming changes the cache key, only changed and deleted waarnemingen invalidate the layer '''
+    if not created:
+        changed(sender)
@@ -0,0 +1,96 @@
+'''
+Downscaled copies of photos, cached on disk
+'''
+import os
+import logging
+import tempfile
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from nzgmeet.fixeau.photos import filehash
+
+logger = logging.getLogger(__name__)
+
+class Derivatives:
+    ''' Cache of photos downscaled to at most max_size pixels (width and height) and saved as jpeg of quality.
+    Photos are rotated according to their EXIF orientation, other metadata (EXIF, thumbnails, comments) is left out.
+    A derivative is stored under the sha1 hash of the source in a folder per setting, so a derivative is made only once
+    for every photo and every change of the source or the settings makes a new one.
+    The export and page renders (template filter derivative in nzgmeet.templatetags.fotos) share the cache.
+    Safe for use by multiple threads and processes. '''
+
+    def __init__(self, folder=None, max_size=1600, quality=80):
+        self.folder = folder or settings.PHOTO_CACHE_DIR
+        self.max_size = max_size
+        self.quality = quality
+        # content hash by (file name, size, mtime)
+        self.hashes = {}
+
+    def path(self, sha1):
+        ''' returns file name of derivative of photo with content hash sha1 '''
+        return os.path.join(self.folder, '{}-q{}'.format(self.max_size, self.quality), sha1[:2], sha1 + '.jpg')
+
+    def hash(self, source):
+        ''' returns sha1 of the contents of file source, a file is read again only when its size or mtime changes '''
+        stat = os.stat(source)
+        key = (source, stat.st_size, int(stat.st_mtime))
+        sha1 = self.hashes.get(key)
+        if sha1 is None:
+            sha1 = self.hashes[key] = filehash(source)
+        return sha1
+
+    def url(self, source):
+        ''' returns url of derivative of file source in MEDIA_ROOT, makes one if it does not exist yet.
+        Returns None when the original should be used '''
+        target = self.get(source, self.hash(source))
+        if target == source:
+            return None
+        return settings.MEDIA_URL + os.path.relpath(target, settings.MEDIA_ROOT).replace(os.sep, '/')
+
+    def get(self, source, sha1):
+        ''' returns file name of derivative of source, makes one if it does not exist yet.
+        Returns source itself when it cannot be processed or processing does not make it smaller '''
+        target = self.path(sha1)
+        if not os.path.exists(target):
+            try:
+                self.make(source, target)
+            except (IOError, OSError, ValueError) as error:
+                logger.warning('Failed to process photo {}: {}'.format(source, error))
+                return source
+        # an empty derivative means the original is used
+        return target if os.path.getsize(target) else source
+
+    def make(self, source, target):
+        ''' save derivative of source as target, or an empty target when the derivative is not smaller than source '''
+        folder = os.path.dirname(target)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # created by another thread
+                if not os.path.isdir(folder):
+                    raise
+        original = Image.open(source)
+        try:
+            image = original
+            if hasattr(ImageOps, 'exif_transpose'):
+                # Pillow >= 6
+                image = ImageOps.exif_transpose(image)
+            image.thumbnail((self.max_size, self.max_size), Image.LANCZOS)
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            # write to a temporary file first, so other threads and processes never see a partial file
+            fd, temp = tempfile.mkstemp(suffix='.jpg', dir=folder)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    image.save(f, 'JPEG', quality=self.quality, optimize=True, progressive=True)
+                if os.path.getsize(temp) >= os.path.getsize(source):
+                    # already small: keep the original, remember the decision with an empty file
+                    open(temp, 'wb').close()
+                os.rename(temp, target)
+            except Exception:
+                os.remove(temp)
+                raise
+        finally:
+            original.close()
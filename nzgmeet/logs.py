@@ -0,0 +1,135 @@
+'''
+Non-blocking logging: log records are put on a queue and written by a single background thread
+'''
+import os
+import copy
+import atexit
+import logging
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from logging.handlers import QueueListener as BaseQueueListener
+except ImportError:
+    # python 2
+    class BaseQueueListener(object):
+        ''' minimal version of logging.handlers.QueueListener of python 3 '''
+        _sentinel = None
+
+        def __init__(self, queue, *handlers, **kwargs):
+            self.queue = queue
+            self.handlers = handlers
+            self.respect_handler_level = kwargs.get('respect_handler_level', False)
+            self._thread = None
+
+        def start(self):
+            self._thread = threading.Thread(target=self._monitor)
+            self._thread.daemon = True
+            self._thread.start()
+
+        def handle(self, record):
+            for handler in self.handlers:
+                if not self.respect_handler_level or record.levelno >= handler.level:
+                    handler.handle(record)
+
+        def _monitor(self):
+            while True:
+                record = self.queue.get()
+                if record is self._sentinel:
+                    break
+                self.handle(record)
+
+        def enqueue_sentinel(self):
+            self.queue.put_nowait(self._sentinel)
+
+        def stop(self):
+            self.enqueue_sentinel()
+            self._thread.join()
+            self._thread = None
+
+class QueueListener(BaseQueueListener):
+
+    def stop(self):
+        if self._thread is not None:
+            super(QueueListener, self).stop()
+        for handler in self.handlers:
+            handler.flush()
+
+class QueueHandler(logging.Handler):
+    ''' Handler that puts records on a queue. A listener thread passes the records to the target handlers.
+    handlers is a list of handler objects, or a dict of handler configurations by name when the handler is created
+    by logging.config.dictConfig ('()': 'nzgmeet.logs.QueueHandler'): these handlers are created by the same configurator,
+    so they can refer to the formatters and filters of the LOGGING setting.
+    The listener is started by the first record of a process, so every process that is forked by the server
+    gets its own listener thread, and stopped (after writing all queued records) at exit. '''
+
+    def __init__(self, handlers=(), maxsize=0):
+        super(QueueHandler, self).__init__()
+        if isinstance(handlers, dict):
+            configurator = getattr(handlers, 'configurator', None)
+            if configurator is None:
+                raise ValueError('Handler configurations need logging.config.dictConfig')
+            handlers = [self.configure(configurator, name, handlers[name]) for name in sorted(handlers)]
+        self.targets = list(handlers)
+        self.maxsize = maxsize
+        self.queue = None
+        self.listener = None
+        self.pid = None
+
+    def configure(self, configurator, name, config):
+        handler = configurator.configure_handler(config)
+        handler.name = name
+        return handler
+
+    def start(self):
+        ''' start a listener in the current process '''
+        self.acquire()
+        try:
+            if self.pid != os.getpid():
+                if self.maxsize == 0 and hasattr(queue, 'SimpleQueue'):
+                    # python >= 3.7: unbounded queue without locking in python code
+                    self.queue = queue.SimpleQueue()
+                else:
+                    self.queue = queue.Queue(self.maxsize)
+                self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+                self.listener.start()
+                if self.pid is None:
+                    atexit.register(self.stop)
+                self.pid = os.getpid()
+        finally:
+            self.release()
+
+    def stop(self):
+        ''' write all queued records and stop the listener of the current process '''
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self.pid = None
+
+    def prepare(self, record):
+        ''' make record safe for another thread: merge arguments into the message and render the traceback.
+        Formatting is left to the target handlers. The record is copied, other handlers still get the original '''
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def emit(self, record):
+        try:
+            if self.pid != os.getpid():
+                self.start()
+            self.queue.put_nowait(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.stop()
+        for target in self.targets:
+            target.close()
+        super(QueueHandler, self).close()
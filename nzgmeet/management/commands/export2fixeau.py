@@ -1,17 +1,33 @@
 # -*- coding: utf-8 -*-
-import os
 import json
 import logging
 import string
+import threading
+import time
+from itertools import chain, groupby
+from operator import itemgetter
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
-import requests
-from requests.exceptions import HTTPError
+from django.db import connection, DatabaseError
+from requests.exceptions import HTTPError, RequestException
 
-from acacia.data.models import Project
 from iom.models import Waarnemer, Meetpunt, Waarneming
-from django.contrib.sites.models import Site
+from nzgmeet import geojson
+from nzgmeet.cache import get_project
+from nzgmeet.fixeau.api import Api, refused
+from nzgmeet.fixeau.catalog import Catalog
+from nzgmeet.fixeau.journal import Journal
+from nzgmeet.fixeau.photos import PhotoUploader
+from nzgmeet.images import Derivatives
+from nzgmeet.fixeau.profile import Profile
+from nzgmeet.fixeau.queries import ExportQuery
+from nzgmeet.fixeau.resample import RULES, AGGREGATES, label, resample
+from nzgmeet.fixeau.serialize import measurements as serialize_measurements
+from nzgmeet.fixeau.stub import StubAdapter
+from nzgmeet.fixeau.users import assign_usernames
+from nzgmeet.models import SeriesSync, ExportStep, UserSync
 
 logger = logging.getLogger(__name__)
 
@@ -25,47 +41,32 @@ def genpasswd(length=8):
     charset = string.ascii_letters + string.digits + '!@#$%&*+=-?.:'
     return genstring(charset,length)
     
-class Api:
-    ''' Interface to api with JWT authorization '''
+def describe(response):
+    ''' returns error details from response body, json if possible '''
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
 
-    def __init__(self, url):
-        self.url = url
-        self.headers = {}
-        
-    def post(self, path, data, **kwargs):
-        url = self.url + path
-        return requests.post(url, json=data, headers=self.headers, **kwargs)
-
-    def put(self, path, id, data):
-        url = self.url + path + str(id) +'/'
-        return requests.put(url, json=data, headers=self.headers)
-
-    def patch(self, path, id, data):
-        url = self.url + path + str(id) +'/'
-        return requests.patch(url, json=data, headers=self.headers)
-
-    def get(self, path, params=None):
-        # prepend self.url to path if required
-        url = path if path.startswith('http') else self.url + path
-        return requests.get(url, params=params, headers=self.headers)
-
-    def login(self, username, password):
-        response = requests.post(self.url+'/token/',{
-            'username': username,
-            'password': password
-        })
-        response.raise_for_status()
-        json = response.json()
-        self.token = json.get('token')
-        self.headers = {
-            'Content-Type': 'application/json',
-            'Authorization':'JWT '+self.token
-        }
-        return self.token
+def batches(iterable, size):
+    ''' yields lists of at most size items from iterable '''
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 class Command(BaseCommand):
     args = ''
     help = 'Exporteer data naar fixeau.com '
+
+    # a batch of measurements that is refused after the retries of the api is sent again batch_retries times,
+    # after batch_backoff * 2 ** attempt seconds or the Retry-After of the response when that is longer
+    batch_retries = 3
+    batch_backoff = 5.0
     
     def add_arguments(self, parser):
         
@@ -81,38 +82,141 @@ class Command(BaseCommand):
                 default = 6,
                 help = 'Folder id for data sources and time series')
 
+        parser.add_argument('--pool-size',
+                action='store',
+                type = int,
+                dest = 'pool_size',
+                default = 10,
+                help = 'Maximum number of keep-alive connections to the API')
+
+        parser.add_argument('--timeout',
+                action='store',
+                type = float,
+                dest = 'timeout',
+                default = 120,
+                help = 'Read timeout in seconds for a single API request')
+
+        parser.add_argument('--retries',
+                action='store',
+                type = int,
+                dest = 'retries',
+                default = 5,
+                help = 'Number of retries (with exponential backoff) on connection errors and 429/5xx responses')
+
+        parser.add_argument('--no-compress',
+                action='store_true',
+                dest = 'no_compress',
+                default = False,
+                help = 'Do not gzip request bodies')
+
+        parser.add_argument('-w','--workers',
+                action='store',
+                type = int,
+                dest = 'workers',
+                default = 1,
+                help = 'Number of meetpunten to export concurrently')
+
+        parser.add_argument('--photo-workers',
+                action='store',
+                type = int,
+                dest = 'photo_workers',
+                default = 4,
+                help = 'Number of concurrent photo uploads')
+
+        parser.add_argument('--photo-size',
+                action='store',
+                type = int,
+                dest = 'photo_size',
+                default = 1600,
+                help = 'Downscale photos to at most this number of pixels wide and high before upload (0 uploads originals)')
+
+        parser.add_argument('--photo-quality',
+                action='store',
+                type = int,
+                dest = 'photo_quality',
+                default = 80,
+                help = 'JPEG quality of downscaled photos')
+
+        parser.add_argument('--full',
+                action='store_true',
+                dest = 'full',
+                default = False,
+                help = 'Send all waarnemingen, not only the ones added since the previous export')
+
+        parser.add_argument('--resume',
+                action='store_true',
+                dest = 'resume',
+                default = False,
+                help = 'Continue an interrupted export where it stopped')
+
+        parser.add_argument('--users',
+                action='store_true',
+                dest = 'users',
+                default = False,
+                help = 'Create user accounts for waarnemers')
+
+        parser.add_argument('--sources',
+                action='store_true',
+                dest = 'sources',
+                default = False,
+                help = 'Create data sources for devices')
+
+        parser.add_argument('--dry-run',
+                action='store_true',
+                dest = 'dry_run',
+                default = False,
+                help = 'Run the export against a local stub of fixeau.com, without storing export state')
+
+        parser.add_argument('--profile',
+                action='store_true',
+                dest = 'profile',
+                default = False,
+                help = 'Report time per phase, requests per endpoint and the slowest meetpunten')
+
+        parser.add_argument('-b','--batch-size',
+                action='store',
+                type = int,
+                dest = 'batch_size',
+                default = 1000,
+                help = 'Number of measurements per request')
+
+        parser.add_argument('--resample',
+                action='store',
+                dest = 'resample',
+                choices = RULES,
+                default = None,
+                help = 'Export EC series aggregated per hour (1H) or day (1D) to separate time series instead of the raw waarnemingen')
+
+        parser.add_argument('--agg',
+                action='store',
+                dest = 'agg',
+                choices = AGGREGATES,
+                default = 'mean',
+                help = 'Aggregation of resampled series')
+
+        parser.add_argument('--no-prefetch',
+                action='store_true',
+                dest = 'no_prefetch',
+                default = False,
+                help = 'Query fixeau.com for every series, source, user and group instead of fetching them all at once')
+
     def findObjects(self, path, query):
         ''' returns json iterator of all objects that satisfies query '''
-        response = self.api.get(path,query)
-        next = True
-        while next:
-            response.raise_for_status()
-            json = response.json()
-            results = json.get('results')
-            if not results:
-                break
-            for result in results:
-                yield result
-            next = json.get('next')
-            if next:
-                response = self.api.get(next)
+        return self.api.findObjects(path, query)
 
     def findFirstObject(self, path, query):
-        ''' returns json of first object that satisfies query '''
+        ''' returns json of first object that satisfies query.
+        Uses the prefetched catalog for paths that it indexes '''
+        if self.catalog and self.catalog.indexes(path):
+            return self.catalog.find(path, query)
         results = self.findObjects(path, query)
         return next(results,None)
 
-    def getObject(self, path, pk):
-        ''' get object by primary key. Path must end with a slash '''
-        response = self.api.get(path+pk)
-        if response.ok:
-            return response.json()
-                
-        if response.status_code != 404:
-            # raise exception (not for 'not found' errors)
-            response.raise_for_status()
-            
-        return None 
+    def created(self, path, obj):
+        ''' register a newly created object in the catalog. Returns obj '''
+        if self.catalog:
+            self.catalog.add(path, obj)
+        return obj
 
     def findGroup(self, name):
         ''' finds a group by name. returns json of group or None when not found '''
@@ -122,69 +226,132 @@ class Command(BaseCommand):
         ''' Create a group with name. Returns json of created group '''
         response = self.api.post('/group/', {'name': name})
         response.raise_for_status()
-        return response.json()
+        return self.created('/group/', response.json())
     
-    def findUser(self, waarnemer):
-        ''' find a user corresponding to a waarnemer or None when not found '''
-        username = str(waarnemer).lower().replace(' ', '')
-        return self.findFirstObject('/user/', {'username': username})
-
-    def createUser(self, waarnemer, group):
-        ''' create user for waarnemer, add index number (max 10) if user already exists. Returns json of created user '''
-        basename = str(waarnemer).lower().replace(' ', '')
-        username = basename
-        password = genpasswd(8)
+    def userData(self, waarnemer, username, group):
+        ''' returns json for a new (inactive) user account of waarnemer '''
         if waarnemer.tussenvoegsel:
             last_name = waarnemer.tussenvoegsel + ' ' + waarnemer.achternaam
         else:
             last_name = waarnemer.achternaam
-        for index in range(1,10):
-            response = self.api.post('/user/', {
-                'username': username, 
-                'password': password,
-                'first_name': waarnemer.voornaam or waarnemer.initialen,
-                'last_name': last_name,
-                'email': waarnemer.email,
-                'groups': [group],
-                'is_active': False,
-                'details': {
-                    'phone_number': waarnemer.telefoon
-                }
-            })
-            if response.ok:
-                break
-            
-            # find out what the problem is..
-            reason = response.json()
-            if 'username' in reason:
-                problems = reason['username']
-                if 'A user with that username already exists.' in problems:
-                    # try again with new username
-                    username = '{}{}'.format(basename,index)
-                    continue
-                    
-        response.raise_for_status()
-        return response.json()
+        return {
+            'username': username, 
+            'password': genpasswd(8),
+            'first_name': waarnemer.voornaam or waarnemer.initialen,
+            'last_name': last_name,
+            'email': waarnemer.email,
+            'groups': [group],
+            'is_active': False,
+            'details': {
+                'phone_number': waarnemer.telefoon
+            }
+        }
+
+    def provisionUsers(self, group, workers=1):
+        ''' make sure every waarnemer has a user account. Usernames are resolved locally against all existing usernames,
+        missing users are created concurrently. Accounts are stored in UserSync, known waarnemers cost no requests.
+        Returns dict of username by waarnemer id '''
+        accounts = {a.waarnemer_id: a for a in UserSync.objects.filter(url=self.api.url)}
+        todo = [w for w in Waarnemer.objects.all() if w.pk not in accounts]
+        logger.info('{} known users, {} waarnemers without user'.format(len(accounts), len(todo)))
+        if todo:
+            if self.catalog:
+                users = self.catalog.getIndex('/user/')
+            else:
+                users = {u['username']: u for u in self.findObjects('/user/', None)}
+            claimed = set(a.username for a in accounts.values())
+            creates = []
+            for w, username, exists in assign_usernames(todo, users, claimed):
+                if exists:
+                    logger.debug('Found user {} with username {} for {}'.format(users[username]['id'], username, w))
+                    accounts[w.pk] = self.saveAccount(w, users[username])
+                else:
+                    creates.append((w, username))
+
+            def create(item):
+                w, username = item
+                try:
+                    response = self.api.post('/user/', self.userData(w, username, group))
+                    response.raise_for_status()
+                    return w, self.created('/user/', response.json()), None
+                except HTTPError as error:
+                    return w, None, describe(error.response)
+                except RequestException as error:
+                    return w, None, error
+
+            pool = ThreadPool(max(workers, 1))
+            try:
+                for w, user, error in pool.imap_unordered(create, creates):
+                    if error is not None:
+                        logger.error('ERROR creating user {}: {}'.format(w, error))
+                        continue
+                    logger.info('Created user {} with username {} for {}'.format(user['id'], user['username'], w))
+                    accounts[w.pk] = self.saveAccount(w, user)
+            finally:
+                pool.close()
+                pool.join()
+        return {pk: account.username for pk, account in accounts.items()}
+
+    def devices(self):
+        ''' yields (device, set of waarnemer ids) for all devices that have been used for waarnemingen.
+        Distinct pairs are computed by the database and read from a cursor. Waarnemingen without a device are left out. '''
+        pairs = (Waarneming.objects.exclude(device__isnull=True).exclude(device='')
+                 .values_list('device', 'waarnemer').distinct().order_by('device', 'waarnemer'))
+        for device, rows in groupby(pairs.iterator(), itemgetter(0)):
+            yield device, set(waarnemer for device, waarnemer in rows)
+
+    def provisionSources(self, group, users, folder=None, workers=1):
+        ''' create a data source for every device that does not exist on fixeau.com yet.
+        users is a dict of username by waarnemer id '''
+        if self.catalog:
+            existing = set(self.catalog.getIndex('/source/'))
+        else:
+            existing = set(s['id'] for s in self.findObjects('/source/', None))
+        stats = {'devices': 0, 'created': 0, 'failed': 0}
+
+        def missing():
+            for device, waarnemers in self.devices():
+                stats['devices'] += 1
+                if device in existing:
+                    logger.debug('Found existing data source {}'.format(device))
+                else:
+                    yield device, [users[w] for w in waarnemers if w in users]
+
+        def create(item):
+            device, usernames = item
+            try:
+                return device, self.createSource(device, usernames, group, folder=folder), None
+            except HTTPError as error:
+                return device, None, describe(error.response)
+            except RequestException as error:
+                return device, None, error
+            except Exception as error:
+                # unexpected: report as a failure of this device, do not abort the other devices
+                logger.exception('ERROR creating data source {}'.format(device))
+                return device, None, error
+
+        pool = ThreadPool(max(workers, 1))
+        try:
+            # imap consumes the devices in the pool's task thread: materialize, it is one row per device
+            for device, source, error in pool.imap_unordered(create, list(missing())):
+                if error is not None:
+                    logger.error('ERROR creating data source {}: {}'.format(device, error))
+                    stats['failed'] += 1
+                else:
+                    logger.debug('Created data source {}'.format(device))
+                    stats['created'] += 1
+        finally:
+            pool.close()
+            pool.join()
+        logger.info('{devices} devices, {created} data sources created, {failed} failed'.format(**stats))
+        return stats
+
+    def saveAccount(self, waarnemer, user):
+        account = UserSync(url=self.api.url, waarnemer=waarnemer, username=user['username'], user=user['id'])
+        if self.persist:
+            account.save()
+        return account
 
-    def addPhoto(self, photo):
-        ''' copy image from server to fixeau.com '''
-        filename = os.path.basename(photo)
-        headers = {}
-        with open(photo,'rb') as f:
-            url = self.api.url
-            headers.update(self.api.headers)
-            # remove content-type from header (content is not json)
-            headers.pop('Content-Type')
-            payload = {'name': filename}
-            files = {'image':(filename, f)}
-            response = requests.post(url+'/photo/', data = payload, headers = headers, files = files)
-            response.raise_for_status()
-            return response.json()
-    
-    def getSource(self, sourceId):
-        ''' return datasource object with sourceid '''
-        return self.getObject('/source/', sourceId)
-        
     def createSource(self, device, users, group, folder=None):
         ''' create a datasource for a device. First add source_type AkvoMobile to database
         device: akvo phone device identifier
@@ -201,14 +368,43 @@ class Command(BaseCommand):
             'users': users 
         })
         response.raise_for_status()
-        return response.json()
+        return self.created('/source/', response.json())
     
-    def findSeries(self, meetpunt, category):
-        ''' find EC time series for a meetpunt and category combination '''
+    def seriesName(self, meetpunt, category):
+        ''' returns name of EC time series for a meetpunt and category combination '''
         # need to make series name unique, filter on category does not work
         name = '{} ({})'.format(meetpunt.name, category) if category else meetpunt.name
+        if self.mode:
+            # resampled series are exported next to the raw series
+            name += ' ' + self.mode
+        return name
+
+    def geometry(self, meetpunt):
+        ''' returns location of meetpunt as geojson point '''
+        if self.locations is None:
+            # transformed by the database once for all meetpunten
+            try:
+                self.locations = geojson.locations()
+            except (DatabaseError, NotImplementedError) as error:
+                # the database can not transform geometries
+                logger.warning('Locations of meetpunten not available from the database: {}'.format(error))
+                self.locations = {}
+        point = self.locations.get(meetpunt.pk)
+        if point is not None:
+            return point
+        location = meetpunt.latlng()
+        return {
+            'coordinates': [
+                location[1],
+                location[0]
+            ],
+            'type': 'Point'
+        }
+
+    def findSeries(self, meetpunt, category):
+        ''' find EC time series for a meetpunt and category combination '''
         return self.findFirstObject('/series/', {
-            'name': name,
+            'name': self.seriesName(meetpunt, category),
             'source': meetpunt.device,
             'parameter': 'EC',
             'category': category
@@ -216,23 +412,16 @@ class Command(BaseCommand):
 
     def createSeries(self, meetpunt, category, folder = None, photo = None):
         ''' create timeseries for a meetpunt, category combination '''
-        location = meetpunt.latlng()
-        # need to make series name unique, filter on category does not work
-        name = '{} ({})'.format(meetpunt.name, category) if category else meetpunt.name
         meta = {'identifier': meetpunt.identifier}
         if photo:
-            meta['imageUrl'] = photo['image']
-            meta['image_id'] = photo['id']
+            meta['imageUrl'] = photo.image
+            meta['image_id'] = photo.photo
+        if self.mode:
+            meta['resample'] = self.mode
         response = self.api.post('/series/', {
-            'name': name,
+            'name': self.seriesName(meetpunt, category),
             'description': meetpunt.displayname,
-            'location': {
-                'coordinates': [
-                    location[1],
-                    location[0]
-                ],
-                'type': 'Point'
-            },
+            'location': self.geometry(meetpunt),
             'meta': meta,
             'folder': folder,
             'source': meetpunt.device,
@@ -241,79 +430,297 @@ class Command(BaseCommand):
             'unit': 'mS/cm'      
         })
         response.raise_for_status()
-        return response.json()
+        return self.created('/series/', response.json())
     
+    def postMeasurements(self, body, size):
+        ''' post a json encoded batch of size measurements, returns number of measurements added.
+        A batch that the server refuses (rate limited or unavailable, see api.refused) is sent again up to batch_retries times,
+        other errors are raised '''
+        for attempt in range(self.batch_retries + 1):
+            response = self.api.send('/measurement/', body)
+            retry_after = response.headers.get('Retry-After')
+            if attempt == self.batch_retries or not refused(response.status_code, bool(retry_after)):
+                break
+            delay = self.batch_backoff * 2 ** attempt
+            try:
+                delay = max(delay, float(retry_after))
+            except (TypeError, ValueError):
+                # no header or a http date
+                pass
+            response.close()
+            logger.warning('Batch of {} measurements refused ({}), sending again in {:.0f}s'.format(size, response.status_code, delay))
+            time.sleep(delay)
+        response.raise_for_status()
+        resp = response.json()
+        if not isinstance(resp, dict):
+            # response is unicode, not dict??
+            resp = json.loads(resp)
+        return resp.get('count', size)
+
+    def streamMeasurements(self, name, items, serialize, done=None):
+        ''' serialize items and upload them in batches of self.batch_size measurements.
+        serialize(batch) returns the json text of a list of items.
+        Every batch is a separate request with its own retries (see postMeasurements). done(batch, count) is called after each successful batch.
+        Returns total number of measurements added '''
+        total = 0
+        rows = 0
+        start = time.time()
+        for index, batch in enumerate(batches(items, self.batch_size)):
+            tic = time.time()
+            with self.profile.phase('serialization'):
+                body = serialize(batch)
+            with self.profile.phase('measurement POST'):
+                count = self.postMeasurements(body, len(batch))
+            if done:
+                done(batch, count)
+            total += count
+            rows += len(batch)
+            now = time.time()
+            logger.debug('{}: batch {} of {} rows in {:.1f}s ({:.0f} rows/s), {} rows in total ({:.0f} rows/s)'.format(
+                name, index + 1, len(batch), now - tic, len(batch) / max(now - tic, 1e-6), rows, rows / max(now - start, 1e-6)))
+        return total
+
     def addMeasurements(self, meetpunt, source, target):
         ''' add all measurements for meetpunt from source time series and set series id to target '''
-        location = meetpunt.latlng()
         device = meetpunt.device
-        measurements = [{
-            'time': p.date.isoformat(),
-            # assume units is μS/cm when EC > 50
-            'value': p.value/1000.0 if p.value > 50 else p.value,
-            'location': {
-                'coordinates': [
-                    location[1],
-                    location[0]
-                ],
-                'type': 'Point'
-            },
-#             'meta': null,
-            'source': device,
-            'parameter': 'EC',
-            'unit': 'mS/cm',
-            'series': target} for p in source.datapoints.order_by('date')]
-        response = self.api.post('/measurement/',measurements)
-        response.raise_for_status()
-        return response.json()
+        geometry = self.geometry(meetpunt)
+
+        def serialize(batch):
+            dates, values = zip(*batch)
+            return serialize_measurements(dates, values, geometry, device, target)
+
+        datapoints = source.datapoints.order_by('date').values_list('date', 'value').iterator()
+        return self.streamMeasurements(str(source), datapoints, serialize)
             
-    def addWaarnemingen(self, meetpunt, queryset, target):
-        ''' add all measurements for meetpunt from waarneming queryset and set series id to target '''
-        location = meetpunt.latlng()
+    def addWaarnemingen(self, meetpunt, rows, target, sync=None):
+        ''' add all measurements for meetpunt from waarneming rows (ordered by pk) and set series id to target.
+        When sync is given, its high-water mark is moved to the last waarneming of every batch that was sent,
+        so a later run continues after the last batch that was sent, also when this run fails. '''
         device = meetpunt.device
+        geometry = self.geometry(meetpunt)
 
-        def waarneming2measurement(waarneming, target):
-            meta = {}
-            if waarneming.foto_url:
-                try:
-                    photo = self.addPhoto(settings.BASE_DIR + waarneming.foto_url)
-                    logger.debug('Added photo {}: {}'.format(photo['id'],photo['name']))
-                    meta['imageUrl'] = photo['image']
-                    meta['image_id'] = photo['id']
-                except:
-                    pass
-            return {
-                'time': waarneming.datum.isoformat(),
-                # assume units is μS/cm when EC > 50
-                'value': waarneming.waarde/1000.0 if waarneming.waarde > 50 else waarneming.waarde,
-                'location': {
-                    'coordinates': [
-                        location[1],
-                        location[0]
-                    ],
-                    'type': 'Point'
-                },
-                'meta': meta,
-                'source': device,
-                'parameter': 'EC',
-                'unit': 'mS/cm',
-                'series': target} 
-            
-        measurements = [waarneming2measurement(waarneming,target) for waarneming in queryset.order_by('datum')]
-        response = self.api.post('/measurement/',measurements)
-        response.raise_for_status()
-        return response.json()
+        def photo_meta(url):
+            if url:
+                # photos have been uploaded before in the photo stage
+                photo = self.photos.get(settings.BASE_DIR + url)
+                if photo:
+                    return {'imageUrl': photo.image, 'image_id': photo.photo}
+            return None
+
+        def serialize(batch):
+            meta = [photo_meta(row.foto_url) for row in batch]
+            return serialize_measurements([row.datum for row in batch], [row.waarde for row in batch], 
+                                          geometry, device, target, meta)
+
+        def done(batch, count):
+            if sync:
+                self.markExported(sync, batch[-1], len(batch))
+                self.journal.batch(meetpunt.pk, sync.category, target, batch[-1])
+
+        return self.streamMeasurements('{} series {}'.format(meetpunt, target), rows, serialize, done)
+
+    def addResampled(self, meetpunt, rows, target, sync=None):
+        ''' add waarneming rows (ordered by datum, pk) of meetpunt to series target, aggregated per interval of self.rule.
+        An interval is only sent when it is complete: when sync is given, its high-water mark is moved
+        to the last waarneming of the last interval of every batch that was sent.
+        Waarnemingen that are added later to an interval that has been sent are not exported. '''
+        device = meetpunt.device
+        geometry = self.geometry(meetpunt)
+
+        def serialize(batch):
+            # values have been normalized before aggregation
+            return serialize_measurements([bucket.datum for bucket in batch], [bucket.waarde for bucket in batch],
+                                          geometry, device, target, convert=False)
+
+        def done(batch, count):
+            if sync:
+                self.markExported(sync, batch[-1].last, len(batch))
+                self.journal.batch(meetpunt.pk, sync.category, target, batch[-1].last)
+
+        buckets = self.profile.timed('resample', resample(rows, self.rule, self.how))
+        return self.streamMeasurements('{} series {}'.format(meetpunt, target), buckets, serialize, done)
+
+    def getSync(self, meetpunt, category, target):
+        ''' returns export state for a meetpunt, category combination, creates one for series target if it does not exist '''
+        key = (meetpunt.pk, category)
+        sync = self.syncs.get(key)
+        if sync is None:
+            if self.persist:
+                sync, created = SeriesSync.objects.get_or_create(url=self.api.url, meetpunt=meetpunt, category=category,
+                                                                 resample=self.mode, defaults={'series': target})
+            else:
+                sync = SeriesSync(url=self.api.url, meetpunt=meetpunt, category=category, resample=self.mode, series=target)
+            self.syncs[key] = sync
+        return sync
+
+    def markExported(self, sync, waarneming, count):
+        ''' move high-water mark of sync to waarneming '''
+        sync.datum = waarneming.datum
+        sync.waarneming = waarneming.pk
+        sync.count += count
+        if self.persist:
+            sync.save(update_fields=['datum','waarneming','count','modified'])
+
+    def exportMeetpunt(self, m, series, folder):
+        ''' export time series and measurements of a single meetpunt. 
+        series iterates over (category, rows) as returned by ExportQuery.meetpunten().
+        Errors are logged and reported in the result, they do not affect other meetpunten.
+        Returns tuple of (meetpunt, statistics, error) '''
+        stats = {'series_found': 0, 'series_created': 0, 'measurements': 0}
+        category = None
+        failure = None
+        start = time.time()
+        try:
+            photo = self.photos.get(settings.BASE_DIR + m.photo_url) if m.photo_url else None
+            for category, rows in series:
+                first = next(rows, None)
+                if first is None:
+                    # nothing new
+                    continue
+                rows = chain([first], rows)
+                sync = self.syncs.get((m.pk, category))
+                if sync:
+                    target = {'id': sync.series}
+                    msg = 'Exporting to time series {} for {}'.format(target['id'], m)
+                    stats['series_found'] += 1
+                else:
+                    with self.profile.phase('series lookup'):
+                        target = self.findSeries(m, category)
+                    if target:
+                        msg = 'Found existing time series {} for {}'.format(target['id'], m)
+                        stats['series_found'] += 1
+                    else:
+                        with self.profile.phase('series create'):
+                            target = self.createSeries(m, category, folder=folder, photo=photo)
+                        msg = 'Created time series {} for {}'.format(target['id'], m)
+                        stats['series_created'] += 1
+                    sync = self.getSync(m, category, target['id'])
+                if category:
+                    msg += ' ({})'.format(category)
+                logger.debug(msg)
+                if not self.journal.done(ExportStep.SERIES, m.pk, category):
+                    self.journal.record(ExportStep.SERIES, m.pk, category, series=target['id'])
+                if self.mode:
+                    count = self.addResampled(m, rows, target['id'], sync)
+                else:
+                    count = self.addWaarnemingen(m, rows, target['id'], sync)
+                logger.debug('Added {} measurements'.format(count))
+                stats['measurements'] += count
+            self.journal.record(ExportStep.MEETPUNT, m.pk)
+
+        except HTTPError as error:
+            # retries exhausted or client error: skip this meetpunt and continue with the next one
+            failure = describe(error.response)
+            logger.error('ERROR creating time series {} ({}): {}'.format(m,category,failure))
+        except RequestException as error:
+            failure = error
+            logger.error('ERROR creating time series {} ({}): {}'.format(m,category,failure))
+        except Exception as error:
+            failure = error
+            logger.exception('ERROR exporting {} ({})'.format(m,category))
+        finally:
+            self.profile.meetpunt(m, time.time() - start)
+            # worker threads each have their own database connection
+            if threading.current_thread().name != 'MainThread':
+                connection.close()
+        return (m, stats, failure)
+
+    def photoPaths(self, meetpunten):
+        ''' returns file names of photos of meetpunten and their EC waarnemingen '''
+        urls = set(m.photo_url for m in meetpunten if m.photo_url)
+        urls.update(ExportQuery().queryset().exclude(foto_url__isnull=True).exclude(foto_url='')
+                    .values_list('foto_url', flat=True).distinct())
+        return [settings.BASE_DIR + url for url in sorted(urls)]
+
+    def exportConcurrent(self, query, meetpunten, folder, workers):
+        ''' export meetpunten on a pool of worker threads. Every worker reads the waarnemingen of its meetpunt
+        with a database cursor of its own, rows are never buffered per meetpunt. At most 2 * workers meetpunten
+        are queued ahead of the workers. Returns summary '''
+        pool = ThreadPool(workers)
+        slots = threading.BoundedSemaphore(2 * workers)
+
+        def task(m, series):
+            try:
+                return self.exportMeetpunt(m, series, folder)
+            finally:
+                # the connection of this thread is not used again until the next meetpunt
+                connection.close()
+                slots.release()
+
+        results = []
+        try:
+            for pk, series in query.separate():
+                slots.acquire()
+                results.append(pool.apply_async(task, (meetpunten[pk], series)))
+            return self.summarize(result.get() for result in results)
+        finally:
+            pool.close()
+            pool.join()
+
+    def summarize(self, results):
+        ''' aggregate results of exportMeetpunt '''
+        summary = {'meetpunten': 0, 'series_found': 0, 'series_created': 0, 'measurements': 0, 'errors': []}
+        for m, stats, error in results:
+            summary['meetpunten'] += 1
+            for key, value in stats.items():
+                summary[key] += value
+            if error is not None:
+                summary['errors'].append((m, error))
+        return summary
+
+    def report(self, summary):
+        logger.info('Exported {meetpunten} meetpunten: {series_created} time series created, {series_found} existing time series, {measurements} measurements added'.format(**summary))
+        errors = summary['errors']
+        if errors:
+            logger.error('{} meetpunten failed:'.format(len(errors)))
+            for m, error in errors:
+                logger.error('  {}: {}'.format(m, error))
 
     def handle(self, *args, **options):
 
         url = options.get('url')
         folder = options.get('folder')        
-        project = Project.objects.first()
-        site = Site.objects.get_current()
+        project = get_project()
         
-        self.api = Api(url)
+        self.full = options.get('full')
+        self.batch_size = options.get('batch_size')
+        # a dry run talks to a stub instead of fixeau.com and does not store any export state
+        dry_run = options.get('dry_run')
+        self.persist = not dry_run
+        self.locations = None
+        self.rule = options.get('resample')
+        self.how = options.get('agg')
+        self.journal = Journal.resume(url, self.persist) if options.get('resume') else None
+        if self.journal:
+            # continue with the settings of the interrupted run
+            self.full = self.journal.run.full
+            self.rule, self.how = self.journal.run.resample.split() if self.journal.run.resample else (None, None)
+        # raw series have no resampling mode
+        self.mode = label(self.rule, self.how) if self.rule else ''
+        if not self.journal:
+            self.journal = Journal.start(url, self.full, self.persist, self.mode)
+        # export state of all time series with this resampling mode that were exported to this url before
+        self.syncs = {(s.meetpunt_id, s.category): s for s in SeriesSync.objects.filter(url=url, resample=self.mode)}
+        if self.full:
+            logger.info('Full export: sending all waarnemingen')
+        if self.mode:
+            logger.info('Resampling EC series: {}'.format(self.mode))
+
+        self.api = Api(url,
+                       pool_size=options.get('pool_size'),
+                       timeout=(10, options.get('timeout')),
+                       retries=options.get('retries'),
+                       transport=StubAdapter() if dry_run else None,
+                       compress=not options.get('no_compress'))
+        self.profile = Profile(url)
+        self.api.hooks.append(self.profile.response)
+        if dry_run:
+            logger.info('Dry run: nothing is sent to {}'.format(url))
         logger.info('Logging in, url={}'.format(url))
         self.api.login(settings.FIXEAU_USERNAME,settings.FIXEAU_PASSWORD)
+
+        # remote objects are fetched in bulk on first lookup
+        self.catalog = None if options.get('no_prefetch') else Catalog(self.api)
         
         # get or create project group
         groupName = project.name
@@ -323,88 +730,47 @@ class Command(BaseCommand):
             group = self.createGroup(groupName)
         groupId = group['id']
              
-#         # get or create users
-#         logger.info('Creating users')
-#         users = {}
-#         for w in Waarnemer.objects.all():
-#             try:
-#                 user = self.findUser(w)
-#                 if user:
-#                     password = ''
-#                     logger.debug('Found user {} with username {} for {}'.format(user['id'], user['username'], w))
-#                 else:
-#                     user = self.createUser(w,groupId)
-#                     logger.info('Created user {} with username {} and password {} for {}'.format(user['id'], user['username'], password, w))
-#                 users[w] = user
-#                          
-#             except HTTPError as error:
-#                 response = error.response
-#                 print('ERROR creating user {}: {}'.format(w,response.json()))
-#                  
-#         # build dictionary of devices with set of waarnemers that have used the device
-#         logger.info('Querying unique devices in '+project.name)
-#         devices = {}    
-#         for w in Waarneming.objects.all():
-#             if w.device in devices:
-#                 devices[w.device].add(w.waarnemer)
-#             else:
-#                 devices[w.device] = set([w.waarnemer])
-#         logger.debug('{} devices found'.format(len(devices)))
-#      
-#         # add devices (create data sources)
-#         logger.info('Creating data sources')
-#         for device, waarnemers in devices.items():
-#             usernames = [users[w]['username'] for w in waarnemers if w in users] 
-#             try:
-#                 source = self.getSource(device)
-#                 if source:
-#                     logger.debug('Found existing data source {}'.format(device))
-#                 else:
-#                     source = self.createSource(device, usernames, groupId, folder=folder)
-#                     logger.debug('Created data source {}'.format(device))
-#             except HTTPError as error:
-#                 response = error.response
-#                 print('ERROR creating data source {}: {}'.format(device,response.json()))
-#                 break
-   
+        if options.get('users'):
+            logger.info('Creating users')
+            users = self.provisionUsers(groupId, options.get('workers'))
+
+        if options.get('sources'):
+            logger.info('Creating data sources')
+            if not options.get('users'):
+                users = {a.waarnemer_id: a.username for a in UserSync.objects.filter(url=self.api.url)}
+            self.provisionSources(groupId, users, folder, options.get('workers'))
+
+        workers = options.get('workers')
+        meetpunten = {m.pk: m for m in Meetpunt.objects.all()}
+
+        size = options.get('photo_size')
+        derivatives = Derivatives(max_size=size, quality=options.get('photo_quality')) if size else None
+        self.photos = PhotoUploader(self.api, workers=options.get('photo_workers'), persist=self.persist, derivatives=derivatives)
+        if not self.journal.done(ExportStep.PHOTOS):
+            logger.info('Uploading photos')
+            with self.profile.phase('photo upload'):
+                stats = self.photos.upload(self.photoPaths(meetpunten.values()))
+            logger.info('Photos: {uploaded} uploaded, {skipped} already on server, {failed} failed'.format(**stats))
+            if stats['uploaded']:
+                logger.info('Photos: {:.1f} MB originals, {:.1f} MB sent ({:.0%})'.format(
+                    stats['original_bytes'] / 1e6, stats['sent_bytes'] / 1e6, stats['sent_bytes'] / float(stats['original_bytes'] or 1)))
+            self.journal.record(ExportStep.PHOTOS)
+
         logger.info('Creating time series')
-        for m in Meetpunt.objects.all():
-            try:
-                if m.photo_url:
-                    try:
-                        photo = self.addPhoto(settings.BASE_DIR + m.photo_url)
-                        logger.debug('Added photo {}: {}'.format(photo['id'],photo['name']))
-                    except:
-                        photo = None
-                else:
-                    photo = None
-                cats = {
-                    'Shallow': m.waarneming_set.filter(naam__iexact="ec_ondiep"),
-                    'Deep': m.waarneming_set.filter(naam__iexact="ec_diep"),
-                    '': m.waarneming_set.filter(naam__iexact="ec")
-                }
-                for category, queryset in cats.items():
-                    if not queryset:
-                        continue
-                    target = self.findSeries(m, category)
-                    if target:
-                        msg = 'Found existing time series {} for {}'.format(target['id'], m)
-                    else:
-                        target = self.createSeries(m, category, folder=folder, photo=photo)
-                        msg = 'Created time series {} for {}'.format(target['id'], m)
-                    if category:
-                        msg += ' ({})'.format(category)
-                    logger.debug(msg)
-                    response = self.addWaarnemingen(m, queryset, target['id'])
-                    if response:
-                        # response is unicode, not dict??
-                        resp = json.loads(response)
-                        logger.debug('Added {} measurements'.format(resp.get('count')))
-                        
-            except HTTPError as error:
-                response = error.response
-                print('ERROR creating time series {} ({}): {}'.format(m,category,response.json()))
-                break # abort
+        # start every series after its high-water mark, or after the last batch of an interrupted run
+        query = ExportQuery(self.syncs, full=self.full, skip=self.journal.completed(), profile=self.profile,
+                            positions=self.journal.positions, resampled=bool(self.mode))
+        if workers > 1:
+            summary = self.exportConcurrent(query, meetpunten, folder, workers)
+        else:
+            summary = self.summarize(self.exportMeetpunt(meetpunten[pk], series, folder) for pk, series in query.meetpunten())
+        self.report(summary)
+        if options.get('profile'):
+            self.profile.report(logger.info)
+        if not summary['errors']:
+            self.journal.finish()
+
+        self.api.close()
             
 #         for m in Meetpunt.objects.all():
 #             try:
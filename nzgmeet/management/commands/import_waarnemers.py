@@ -3,44 +3,123 @@ Created on Aug 6, 2015
 
 @author: theo
 '''
+import sys
+import csv
+
+from django.core.exceptions import ValidationError
 from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from optparse import make_option
-from iom.models import Waarnemer, Meetpunt, CartoDb
-from django.contrib.gis.geos import Point
-from acacia.data.models import ProjectLocatie
-import csv, logging, uuid
-from dateutil import parser
-from iom.util import updateSeries, updateCartodb 
+from django.db import transaction
+from iom.models import Waarnemer
+
+# csv column by Waarnemer field
+NATURAL_KEY = (
+    ('achternaam', 'Achternaam'),
+    ('voornaam', 'Voornaam'),
+    ('initialen', 'Initialen'),
+    ('tussenvoegsel', 'Tussen'),
+)
+FIELDS = (
+    ('telefoon', 'Nummer'),
+    ('email', 'Mail'),
+)
+
+def natural_key(values):
+    ''' returns natural key of a waarnemer from a dict or Waarnemer instance (None and blank are the same) '''
+    get = values.get if isinstance(values, dict) else lambda name: getattr(values, name)
+    return tuple(get(name) or '' for name, column in NATURAL_KEY)
 
-logger = logging.getLogger('akvo')
+def clean(name, value):
+    ''' returns csv value converted to the python type of field name (for instance PhoneNumber for telefoon),
+    so it can be compared with the value of an existing waarnemer '''
+    try:
+        return Waarnemer._meta.get_field(name).to_python(value)
+    except ValidationError:
+        return value
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 class Command(BaseCommand):
     args = ''
-    help = 'Importeer csv file met waarnemenrs'
-    option_list = BaseCommand.option_list + (
-            make_option('--file',
+    help = 'Importeer csv file met waarnemers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-f','--file',
                 action='store',
                 dest = 'file',
-                default = '/media/sf_F_DRIVE/projdirs/NZG/waarnemers.csv',
-                help = 'naam van csv bestand'),
-        )
-    
+                default = '-',
+                help = 'naam van csv bestand (- voor stdin)')
+
+        parser.add_argument('--chunk-size',
+                action='store',
+                type = int,
+                dest = 'chunk_size',
+                default = 1000,
+                help = 'aantal regels per bulk insert/update')
+
+    def flush(self, creates, updates):
+        ''' insert and update a chunk of waarnemers '''
+        if creates:
+            Waarnemer.objects.bulk_create(creates)
+        if hasattr(Waarnemer.objects, 'bulk_update'):
+            Waarnemer.objects.bulk_update(updates, [name for name, column in FIELDS])
+        else:
+            # Django < 2.2
+            for w in updates:
+                w.save(update_fields=[name for name, column in FIELDS])
+
+    def load(self, csvfile, chunk_size):
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'duplicates': 0}
+        # existing waarnemers by natural key
+        index = {natural_key(w): w for w in Waarnemer.objects.all()}
+        reader = csv.DictReader(csvfile)
+        # keys of waarnemers in the file: the first row of a waarnemer is used, later rows are duplicates
+        seen = set()
+        with transaction.atomic():
+            for chunk in chunks(reader, chunk_size):
+                creates = []
+                updates = []
+                for row in chunk:
+                    values = {name: row[column] for name, column in NATURAL_KEY}
+                    values.update({name: clean(name, row[column]) for name, column in FIELDS})
+                    key = natural_key(values)
+                    if key in seen:
+                        stats['duplicates'] += 1
+                        continue
+                    seen.add(key)
+                    waarnemer = index.get(key)
+                    if waarnemer is None:
+                        creates.append(Waarnemer(**values))
+                        stats['inserted'] += 1
+                        continue
+                    changed = False
+                    for name, column in FIELDS:
+                        if not (getattr(waarnemer, name) == values[name]):
+                            setattr(waarnemer, name, values[name])
+                            changed = True
+                    if not changed:
+                        stats['unchanged'] += 1
+                        continue
+                    stats['updated'] += 1
+                    updates.append(waarnemer)
+                self.flush(creates, updates)
+        return stats
+
     def handle(self, *args, **options):
         fname = options.get('file', None)
         if not fname:
-            print 'filenaam ontbreekt'
+            print('filenaam ontbreekt')
             return
-        project = ProjectLocatie.objects.get(name='NZG') # NZG
-        user = User.objects.get(username='theo') # admin
-
-        with open(fname) as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                aname = row['Achternaam']
-                vname = row['Voornaam']
-                init = row['Initialen']
-                tus = row['Tussen']
-                email = row['Mail']
-                tel = row['Nummer']
-                waarnemer,created = Waarnemer.objects.get_or_create(achternaam=aname,voornaam=vname,initialen=init,tussenvoegsel=tus,defaults={'telefoon': tel,'email': email})
+        if fname == '-':
+            stats = self.load(sys.stdin, options.get('chunk_size'))
+        else:
+            with open(fname) as csvfile:
+                stats = self.load(csvfile, options.get('chunk_size'))
+        self.stdout.write('{inserted} waarnemers toegevoegd, {updated} bijgewerkt, {unchanged} ongewijzigd, {duplicates} dubbele regels overgeslagen'.format(**stats))
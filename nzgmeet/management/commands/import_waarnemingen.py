@@ -0,0 +1,219 @@
+'''
+Bulk import of waarnemingen from csv or excel files
+'''
+import os
+import time
+import logging
+
+import pandas as pd
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import six
+
+from iom.models import Meetpunt, Waarnemer, Waarneming
+
+logger = logging.getLogger(__name__)
+
+# fields of Waarneming by column in the file, meetpunt and waarnemer are resolved to primary keys
+COLUMNS = (
+    ('meetpunt', 'locatie'),
+    ('waarnemer', 'waarnemer'),
+    ('naam', 'naam'),
+    ('datum', 'datum'),
+    ('waarde', 'waarde'),
+    ('device', 'device'),
+    ('foto_url', 'foto_url'),
+)
+REQUIRED = ('meetpunt', 'waarnemer', 'naam', 'datum', 'waarde')
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Importeer waarnemingen uit csv of excel bestand'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-f','--file',
+                action='store',
+                dest = 'file',
+                help = 'naam van csv of excel (xls, xlsx) bestand')
+
+        parser.add_argument('--sheet',
+                action='store',
+                dest = 'sheet',
+                default = 0,
+                help = 'naam of volgnummer van werkblad in excel bestand')
+
+        parser.add_argument('--sep',
+                action='store',
+                dest = 'sep',
+                default = ',',
+                help = 'scheidingsteken van csv bestand')
+
+        parser.add_argument('--naam',
+                action='store',
+                dest = 'naam',
+                default = None,
+                help = 'naam van waarnemingen als het bestand geen kolom naam heeft, bijvoorbeeld EC_ondiep')
+
+        parser.add_argument('--waarnemer',
+                action='store',
+                dest = 'waarnemer',
+                default = None,
+                help = 'naam of email van de waarnemer als het bestand geen kolom waarnemer heeft')
+
+        parser.add_argument('--chunk-size',
+                action='store',
+                type = int,
+                dest = 'chunk_size',
+                default = 50000,
+                help = 'aantal regels dat tegelijk wordt ingelezen (alleen csv, excel wordt in zijn geheel ingelezen)')
+
+    def chunks(self, fname, options):
+        ''' yields DataFrames with at most chunk_size rows of the file.
+        A csv file is read chunk by chunk, an excel sheet can only be read in full: memory use grows with the size of the sheet,
+        convert large sheets to csv first '''
+        size = options.get('chunk_size')
+        if os.path.splitext(fname)[1].lower() in ('.xls', '.xlsx'):
+            sheet = options.get('sheet')
+            frame = pd.read_excel(fname, sheet_name=int(sheet) if str(sheet).isdigit() else sheet)
+            for start in range(0, len(frame), size):
+                yield frame.iloc[start:start + size]
+        else:
+            for frame in pd.read_csv(fname, sep=options.get('sep'), chunksize=size, dtype={'meetpunt': str, 'waarnemer': str}):
+                yield frame
+
+    def keys(self):
+        ''' returns dicts for lookup of meetpunt and waarnemer primary keys.
+        Meetpunt names are not unique: a name that is used by more than one meetpunt maps to None '''
+        meetpunten = {}
+        for name, pk in Meetpunt.objects.values_list('name', 'pk'):
+            meetpunten[name] = pk if name not in meetpunten else None
+        waarnemers = {}
+        for w in Waarnemer.objects.all():
+            waarnemers[str(w).strip().lower()] = w.pk
+            if w.email:
+                waarnemers[w.email.strip().lower()] = w.pk
+        return meetpunten, waarnemers
+
+    def prepare(self, frame, meetpunten, waarnemers, naam, waarnemer=None):
+        ''' returns DataFrame with columns named after Waarneming fields, foreign keys resolved to primary keys,
+        rows with missing or unknown values left out and duplicates within frame removed.
+        Raises CommandError when a meetpunt name belongs to more than one meetpunt.
+        Returns tuple of (DataFrame, number of invalid rows, number of duplicates) '''
+        frame = frame.rename(columns=lambda c: str(c).strip().lower())
+        if naam is not None:
+            frame['naam'] = naam
+        if waarnemer is not None:
+            frame['waarnemer'] = waarnemer
+        missing = [column for column in REQUIRED if column not in frame.columns]
+        if missing:
+            raise CommandError('kolom(men) ontbreken: {}'.format(', '.join(missing)))
+        data = pd.DataFrame(index=frame.index)
+        names = frame['meetpunt'].astype(str).str.strip()
+        ambiguous = sorted(name for name in names.unique() if name in meetpunten and meetpunten[name] is None)
+        if ambiguous:
+            raise CommandError('meetpunt naam niet uniek: {}'.format(', '.join(ambiguous)))
+        data['locatie'] = names.map(meetpunten)
+        data['waarnemer'] = frame['waarnemer'].astype(str).str.strip().str.lower().map(waarnemers)
+        naam = frame['naam']
+        data['naam'] = naam.where(naam.isnull(), naam.astype(str).str.strip())
+        datum = pd.to_datetime(frame['datum'], errors='coerce', dayfirst=True)
+        if settings.USE_TZ and datum.dt.tz is None:
+            datum = datum.dt.tz_localize(settings.TIME_ZONE, ambiguous='NaT', nonexistent='NaT')
+        data['datum'] = datum
+        data['waarde'] = pd.to_numeric(frame['waarde'], errors='coerce')
+        for column in ('device', 'foto_url'):
+            if column in frame.columns:
+                # an empty column is read as float, where() would keep NaN in a float column
+                data[column] = frame[column].astype(object).where(frame[column].notnull(), None)
+        valid = data[['locatie', 'waarnemer', 'naam', 'datum', 'waarde']].notnull().all(axis=1)
+        data = data[valid].astype({'locatie': int, 'waarnemer': int})
+        unique = data.drop_duplicates(['locatie', 'naam', 'datum'])
+        return unique, int((~valid).sum()), len(data) - len(unique)
+
+    def copy(self, frames):
+        ''' import with PostgreSQL COPY into a temporary table followed by a single INSERT of the new rows.
+        Returns (rows copied, rows inserted) '''
+        table = Waarneming._meta.db_table
+        copied = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            fields = None
+            for data in frames:
+                if fields is None:
+                    fields = list(data.columns)
+                    names = [Waarneming._meta.get_field(name).column for name in fields]
+                    columns = ', '.join(names)
+                    cursor.execute('CREATE TEMPORARY TABLE import_waarneming ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA'.format(
+                        columns, table))
+                # text buffer of the native str type, copy_expert reads it under python 2 and 3
+                buf = six.StringIO()
+                data[fields].to_csv(buf, header=False, index=False, date_format='%Y-%m-%dT%H:%M:%S%z')
+                buf.seek(0)
+                # psycopg2 cursor of the django cursor wrapper
+                cursor.cursor.copy_expert('COPY import_waarneming ({}) FROM STDIN WITH (FORMAT csv)'.format(columns), buf)
+                copied += len(data)
+            if fields is None:
+                return 0, 0
+            locatie = Waarneming._meta.get_field('locatie').column
+            cursor.execute('ANALYZE import_waarneming')
+            # one row per (meetpunt, naam, datum), only when it is not in the table yet
+            cursor.execute('''INSERT INTO {table} ({columns})
+                SELECT DISTINCT ON (i.{locatie}, i.naam, i.datum) {selection} FROM import_waarneming i
+                WHERE NOT EXISTS (SELECT 1 FROM {table} w WHERE w.{locatie} = i.{locatie} AND w.naam = i.naam AND w.datum = i.datum)
+                ORDER BY i.{locatie}, i.naam, i.datum'''.format(
+                    table=table, columns=columns, selection=', '.join('i.' + name for name in names), locatie=locatie))
+            return copied, cursor.rowcount
+
+    def insert(self, frames):
+        ''' import with bulk_create, rows that exist already are skipped. Returns (rows read, rows inserted) '''
+        read = 0
+        inserted = 0
+        with transaction.atomic():
+            for data in frames:
+                read += len(data)
+                if data.empty:
+                    continue
+                # existing keys in the range of this chunk (includes rows of previous chunks)
+                existing = set(Waarneming.objects.filter(locatie__in=data['locatie'].unique().tolist(),
+                                                         datum__range=(data['datum'].min().to_pydatetime(), data['datum'].max().to_pydatetime()))
+                               .values_list('locatie', 'naam', 'datum'))
+                objects = []
+                for row in data.to_dict('records'):
+                    datum = row['datum'].to_pydatetime()
+                    if (row['locatie'], row['naam'], datum) in existing:
+                        continue
+                    values = {name if name not in ('locatie', 'waarnemer') else name + '_id': value for name, value in row.items()}
+                    values['datum'] = datum
+                    objects.append(Waarneming(**values))
+                Waarneming.objects.bulk_create(objects, batch_size=1000)
+                inserted += len(objects)
+        return read, inserted
+
+    def handle(self, *args, **options):
+        fname = options.get('file', None)
+        if not fname:
+            raise CommandError('filenaam ontbreekt')
+        start = time.time()
+        meetpunten, waarnemers = self.keys()
+        waarnemer = options.get('waarnemer')
+        if waarnemer is not None and waarnemer.strip().lower() not in waarnemers:
+            raise CommandError('waarnemer {} niet gevonden'.format(waarnemer))
+        stats = {'rows': 0, 'rejected': 0, 'duplicates': 0}
+
+        def frames():
+            for chunk in self.chunks(fname, options):
+                data, rejected, duplicates = self.prepare(chunk, meetpunten, waarnemers, options.get('naam'), options.get('waarnemer'))
+                stats['rows'] += len(chunk)
+                stats['rejected'] += rejected
+                stats['duplicates'] += duplicates
+                logger.debug('{} regels gelezen, {:.0f} regels/s'.format(stats['rows'], stats['rows'] / max(time.time() - start, 1e-6)))
+                yield data
+
+        if connection.vendor == 'postgresql':
+            valid, inserted = self.copy(frames())
+        else:
+            valid, inserted = self.insert(frames())
+        seconds = time.time() - start
+        self.stdout.write('{} regels in {:.1f}s ({:.0f} regels/s): {} waarnemingen toegevoegd, {} dubbel, {} ongeldig of onbekend meetpunt/waarnemer'.format(
+            stats['rows'], seconds, stats['rows'] / max(seconds, 1e-6), inserted, stats['duplicates'] + valid - inserted, stats['rejected']))
@@ -3,17 +3,90 @@ Created on May 18, 2014
 
 @author: theo
 '''
+import time
+import shutil
+import tempfile
+
 from django.core.management.base import BaseCommand
-from django.core.mail import send_mail
+from django.core.mail import send_mail, get_connection
+
+from nzgmeet.alarms import Dispatcher, FROM, dispatcher, send_alarm
+
+BACKENDS = {
+    'locmem': 'django.core.mail.backends.locmem.EmailBackend',
+    'file': 'django.core.mail.backends.filebased.EmailBackend',
+}
 
 class Command(BaseCommand):
     args = ''
     help = 'Check email functionality'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--burst',
+                action='store',
+                type = int,
+                dest = 'burst',
+                default = 0,
+                help = 'send a burst of this many alarms with a test email backend and report throughput')
+
+        parser.add_argument('--recipients',
+                action='store',
+                type = int,
+                dest = 'recipients',
+                default = 10,
+                help = 'number of recipients of alarms in a burst')
+
+        parser.add_argument('--backend',
+                action='store',
+                dest = 'backend',
+                choices = sorted(BACKENDS),
+                default = 'locmem',
+                help = 'email backend for a burst')
+
+        parser.add_argument('--window',
+                action='store',
+                type = float,
+                dest = 'window',
+                default = 1.0,
+                help = 'seconds to combine alarms per recipient in a burst')
+
+    def burst(self, count, recipients, backend, window):
+        folder = tempfile.mkdtemp()
+        options = {'file_path': folder} if backend == 'file' else {}
+        backend = BACKENDS[backend]
+        addresses = ['alarm{}@example.com'.format(i) for i in range(recipients)]
+        alarms = [([addresses[i % recipients]], '[NZGMeet] Test alarm {}'.format(i), 'EC overschrijding meetpunt {}'.format(i))
+                  for i in range(count)]
+        try:
+            # one send_mail per alarm, every call opens its own connection
+            tic = time.time()
+            for recipient, subject, message in alarms:
+                send_mail(subject, message, FROM, recipient, connection=get_connection(backend, **options))
+            direct = time.time() - tic
+
+            # from the first alarm in the queue until the last mail has been sent
+            burst = Dispatcher(window=window, backend=backend, **options)
+            tic = time.time()
+            for alarm in alarms:
+                burst.send(*alarm)
+            queued = time.time() - tic
+            burst.stop()
+            total = time.time() - tic
+        finally:
+            shutil.rmtree(folder)
+        self.stdout.write('send_mail:  {} alarms in {:.3f}s, {:.0f} alarms/s'.format(count, direct, count / direct))
+        self.stdout.write('dispatcher: {} alarms queued in {:.3f}s ({:.1f} us/alarm in caller), {} mails sent in {:.3f}s, {:.0f} alarms/s (window {}s)'.format(
+            count, queued, queued / count * 1e6, burst.stats['mails'], total, count / total, window))
+
     def handle(self, *args, **options):
+        count = options.get('burst')
+        if count:
+            self.burst(count, options.get('recipients'), options.get('backend'), options.get('window'))
+            return
         subject = '[NZGMeet] Email test'
         message = 'Hallo,\nDeze mail komt van de nzgmeet.nl server en is bedoeld om de email te testen.\nGroeten, Theo'
-        fromaddr = 'NZGMeet Alarm <alarm@nzgmeet.nl>'
         recipients = ['theo.kleinendorst@acaciawater.com',]
-        send_mail(subject, message, fromaddr, recipients)
-    
\ No newline at end of file
+        # same path as the alarms of the application
+        send_alarm(recipients, subject, message)
+        dispatcher.stop()
+        self.stdout.write('Sent {mails} mails, {failed} failed'.format(**dispatcher.stats))
@@ -0,0 +1,208 @@
+'''
+Per-request timing of views and sql queries
+'''
+import os
+import math
+import time
+import random
+import cProfile
+import logging
+import threading
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:
+    # Django < 1.10
+    MiddlewareMixin = object
+
+logger = logging.getLogger(__name__)
+
+def percentile(values, p):
+    ''' returns p-th percentile (nearest rank) of a sorted list of values '''
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(math.ceil(p / 100.0 * len(values))) - 1))
+    return values[index]
+
+class Statistics:
+    ''' Rolling statistics per url pattern of the last window requests. Safe for use by multiple threads '''
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.lock = threading.Lock()
+        # pattern -> deque of (seconds, queries, sql seconds, duplicates)
+        self.requests = defaultdict(lambda: deque(maxlen=self.window))
+
+    def add(self, pattern, seconds, queries, sql, duplicates):
+        with self.lock:
+            self.requests[pattern].append((seconds, queries, sql, duplicates))
+
+    def summary(self):
+        ''' returns list of dicts with statistics per url pattern, slowest p95 first '''
+        with self.lock:
+            items = [(pattern, list(requests)) for pattern, requests in self.requests.items()]
+        result = []
+        for pattern, requests in items:
+            times = sorted(r[0] for r in requests)
+            count = len(requests)
+            result.append({
+                'pattern': pattern,
+                'count': count,
+                'p50': percentile(times, 50),
+                'p95': percentile(times, 95),
+                'max': times[-1],
+                'queries': sum(r[1] for r in requests) / float(count),
+                'sql': sum(r[2] for r in requests) / float(count),
+                'duplicates': sum(r[3] for r in requests) / float(count),
+            })
+        return sorted(result, key=lambda item: -item['p95'])
+
+statistics = Statistics(getattr(settings, 'PROFILE_WINDOW', 1000))
+
+class RecordingCursor(object):
+    ''' Cursor wrapper that adds sql and execution time of every statement to a QueryRecorder '''
+
+    def __init__(self, cursor, recorder):
+        self.cursor = cursor
+        self.recorder = recorder
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def timed(self, method, sql, *args):
+        tic = time.time()
+        try:
+            return method(sql, *args)
+        finally:
+            self.recorder.queries.append((sql, time.time() - tic))
+
+    def execute(self, sql, params=None):
+        return self.timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self.timed(self.cursor.executemany, sql, param_list)
+
+class QueryRecorder:
+    ''' Records sql and execution time of the queries of a request on the database connection of the current thread.
+    Uses execute wrappers when available (Django >= 2.0), otherwise the cursors of the connection are wrapped.
+    Both see sql without parameters, so queries that only differ in parameters (n+1 queries) count as duplicates '''
+
+    def __init__(self):
+        self.queries = []
+        self.connection = connections[DEFAULT_DB_ALIAS]
+        self.wrappers = getattr(self.connection, 'execute_wrappers', None)
+
+    def __call__(self, execute, sql, params, many, context):
+        tic = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.time() - tic))
+
+    def start(self):
+        if self.wrappers is not None:
+            self.wrappers.append(self)
+        else:
+            # instance attributes hide the methods of the class until stop() removes them
+            make_cursor = self.connection.make_cursor
+            make_debug_cursor = self.connection.make_debug_cursor
+            self.connection.make_cursor = lambda cursor: RecordingCursor(make_cursor(cursor), self)
+            self.connection.make_debug_cursor = lambda cursor: RecordingCursor(make_debug_cursor(cursor), self)
+
+    def stop(self):
+        if self.wrappers is not None:
+            if self in self.wrappers:
+                self.wrappers.remove(self)
+        else:
+            for name in ('make_cursor', 'make_debug_cursor'):
+                self.connection.__dict__.pop(name, None)
+        return self.queries
+
+class ProfileMiddleware(MiddlewareMixin):
+    ''' Measures wall time, number of sql queries, sql time and duplicate queries of every request.
+    Results are sent to the client in a Server-Timing header and added to the rolling statistics per url pattern.
+    A fraction PROFILE_SAMPLE_RATE of requests is run under cProfile, the profiles are saved in LOGGING_ROOT/profiles.
+    The body of a StreamingHttpResponse is produced after the middleware has returned,
+    for streamed downloads only the time until the first byte and the queries before it are measured '''
+
+    def process_request(self, request):
+        request._profile_start = time.time()
+        recorder = QueryRecorder()
+        recorder.start()
+        request._profile_queries = recorder
+        rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        if rate and random.random() < rate:
+            profiler = cProfile.Profile()
+            request._profile_cprofile = profiler
+            profiler.enable()
+
+    def pattern(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            return match.view_name or match.url_name or request.path
+        return 'unresolved'
+
+    def finish(self, request):
+        ''' stop measuring request and add it to the statistics, returns (seconds, queries) or None when
+        process_request has not been called (an earlier middleware returned a response). Safe to call more than once '''
+        start = getattr(request, '_profile_start', None)
+        if start is None:
+            return None
+        result = getattr(request, '_profile_result', None)
+        if result is not None:
+            return result
+        profiler = getattr(request, '_profile_cprofile', None)
+        try:
+            if profiler is not None:
+                profiler.disable()
+        finally:
+            queries = request._profile_queries.stop()
+        seconds = time.time() - start
+        result = request._profile_result = (seconds, queries)
+        pattern = self.pattern(request)
+        statistics.add(pattern, seconds, len(queries), self.sql(queries), self.duplicates(queries))
+        if profiler is not None:
+            self.dump(profiler, pattern)
+        return result
+
+    def sql(self, queries):
+        return sum(duration for statement, duration in queries)
+
+    def duplicates(self, queries):
+        return len(queries) - len(set(statement for statement, duration in queries))
+
+    def process_exception(self, request, exception):
+        # the view raised: stop the profiler and the recorder here, process_response is not guaranteed to follow
+        self.finish(request)
+        return None
+
+    def process_response(self, request, response):
+        result = self.finish(request)
+        if result is None:
+            return response
+        seconds, queries = result
+        response['Server-Timing'] = 'total;dur={:.1f}, sql;dur={:.1f};desc="{} queries, {} duplicate"'.format(
+            seconds * 1000, self.sql(queries) * 1000, len(queries), self.duplicates(queries))
+        return response
+
+    def dump(self, profiler, pattern):
+        folder = os.path.join(settings.LOGGING_ROOT, 'profiles')
+        try:
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            name = '{}-{}.prof'.format(time.strftime('%Y%m%d-%H%M%S'), ''.join(c if c.isalnum() else '_' for c in pattern))
+            profiler.dump_stats(os.path.join(folder, name))
+        except (IOError, OSError) as error:
+            logger.warning('Failed to save profile of {}: {}'.format(pattern, error))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('iom', '__first__'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeriesSync',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(help_text='API url', max_length=200)),
+                ('category', models.CharField(blank=True, max_length=20)),
+                ('series', models.IntegerField(help_text='id of time series on fixeau.com')),
+                ('datum', models.DateTimeField(blank=True, help_text='datum of last exported waarneming', null=True)),
+                ('waarneming', models.IntegerField(blank=True, help_text='primary key of last exported waarneming', null=True)),
+                ('count', models.IntegerField(default=0, help_text='total number of exported waarnemingen')),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('meetpunt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='iom.Meetpunt')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='seriessync',
+            unique_together=set([('url', 'meetpunt', 'category')]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nzgmeet', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoSync',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(help_text='API url', max_length=200)),
+                ('path', models.CharField(help_text='local file name', max_length=255)),
+                ('size', models.IntegerField()),
+                ('mtime', models.IntegerField()),
+                ('sha1', models.CharField(db_index=True, max_length=40)),
+                ('photo', models.IntegerField(help_text='id of photo on fixeau.com')),
+                ('image', models.CharField(help_text='url of image on fixeau.com', max_length=255)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='photosync',
+            unique_together=set([('url', 'path')]),
+        ),
+    ]
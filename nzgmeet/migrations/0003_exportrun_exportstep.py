@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iom', '__first__'),
+        ('nzgmeet', '0002_photosync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(help_text='API url', max_length=200)),
+                ('full', models.BooleanField(default=False, help_text='all waarnemingen are exported')),
+                ('started', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExportStep',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.CharField(choices=[('photos', 'photo upload'), ('series', 'time series'), ('batch', 'batch of measurements'), ('meetpunt', 'meetpunt')], max_length=10)),
+                ('category', models.CharField(blank=True, max_length=20)),
+                ('series', models.IntegerField(blank=True, help_text='id of time series on fixeau.com', null=True)),
+                ('batch', models.IntegerField(blank=True, help_text='batch number within series', null=True)),
+                ('datum', models.DateTimeField(blank=True, help_text='datum of last waarneming in batch', null=True)),
+                ('waarneming', models.IntegerField(blank=True, help_text='primary key of last waarneming in batch', null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('meetpunt', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='iom.Meetpunt')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='nzgmeet.ExportRun')),
+            ],
+        ),
+    ]
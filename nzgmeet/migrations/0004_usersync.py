@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iom', '__first__'),
+        ('nzgmeet', '0003_exportrun_exportstep'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSync',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(help_text='API url', max_length=200)),
+                ('username', models.CharField(max_length=150)),
+                ('user', models.IntegerField(help_text='id of user on fixeau.com')),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('waarnemer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='iom.Waarnemer')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='usersync',
+            unique_together=set([('url', 'waarnemer')]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iom', '__first__'),
+        ('nzgmeet', '0004_usersync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seriessync',
+            name='resample',
+            field=models.CharField(blank=True, default='', help_text='resampling of series, for instance "1H mean"', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='exportrun',
+            name='resample',
+            field=models.CharField(blank=True, default='', help_text='resampling of series, for instance "1H mean"', max_length=20),
+        ),
+        migrations.AlterUniqueTogether(
+            name='seriessync',
+            unique_together=set([('url', 'meetpunt', 'category', 'resample')]),
+        ),
+    ]
@@ -0,0 +1,106 @@
+'''
+Bookkeeping for exports of nzgmeet data to fixeau.com
+'''
+from django.db import models
+
+class SeriesSync(models.Model):
+    ''' Export state of a time series on fixeau.com: the remote series id and 
+    the last waarneming (by datum, pk) that has been sent to that series '''
+    url = models.CharField(max_length=200, help_text='API url')
+    meetpunt = models.ForeignKey('iom.Meetpunt', on_delete=models.CASCADE)
+    category = models.CharField(max_length=20, blank=True)
+    resample = models.CharField(max_length=20, blank=True, default='', help_text='resampling of series, for instance "1H mean"')
+    series = models.IntegerField(help_text='id of time series on fixeau.com')
+    datum = models.DateTimeField(null=True, blank=True, help_text='datum of last exported waarneming')
+    waarneming = models.IntegerField(null=True, blank=True, help_text='primary key of last exported waarneming')
+    count = models.IntegerField(default=0, help_text='total number of exported waarnemingen')
+    modified = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return '{} ({}{}) -> {}'.format(self.meetpunt, self.category, ' ' + self.resample if self.resample else '', self.series)
+
+    def __str__(self):
+        return self.__unicode__()
+
+    class Meta:
+        unique_together = ('url', 'meetpunt', 'category', 'resample')
+
+class PhotoSync(models.Model):
+    ''' Photo that has been uploaded to fixeau.com. 
+    size and mtime are used to detect changes of the local file, sha1 identifies the content '''
+    url = models.CharField(max_length=200, help_text='API url')
+    path = models.CharField(max_length=255, help_text='local file name')
+    size = models.IntegerField()
+    mtime = models.IntegerField()
+    sha1 = models.CharField(max_length=40, db_index=True)
+    photo = models.IntegerField(help_text='id of photo on fixeau.com')
+    image = models.CharField(max_length=255, help_text='url of image on fixeau.com')
+    modified = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return '{} -> {}'.format(self.path, self.photo)
+
+    def __str__(self):
+        return self.__unicode__()
+
+    class Meta:
+        unique_together = ('url', 'path')
+
+class ExportRun(models.Model):
+    ''' A run of the fixeau.com export. Runs that did not finish can be resumed '''
+    url = models.CharField(max_length=200, help_text='API url')
+    full = models.BooleanField(default=False, help_text='all waarnemingen are exported')
+    resample = models.CharField(max_length=20, blank=True, default='', help_text='resampling of series, for instance "1H mean"')
+    started = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __unicode__(self):
+        return '{} {}'.format(self.url, self.started)
+
+    def __str__(self):
+        return self.__unicode__()
+
+class ExportStep(models.Model):
+    ''' Journal entry for a completed step of an export run '''
+    PHOTOS = 'photos'
+    SERIES = 'series'
+    BATCH = 'batch'
+    MEETPUNT = 'meetpunt'
+    STEPS = (
+        (PHOTOS, 'photo upload'),
+        (SERIES, 'time series'),
+        (BATCH, 'batch of measurements'),
+        (MEETPUNT, 'meetpunt'),
+    )
+    run = models.ForeignKey(ExportRun, on_delete=models.CASCADE)
+    step = models.CharField(max_length=10, choices=STEPS)
+    meetpunt = models.ForeignKey('iom.Meetpunt', null=True, blank=True, on_delete=models.CASCADE)
+    category = models.CharField(max_length=20, blank=True)
+    series = models.IntegerField(null=True, blank=True, help_text='id of time series on fixeau.com')
+    batch = models.IntegerField(null=True, blank=True, help_text='batch number within series')
+    datum = models.DateTimeField(null=True, blank=True, help_text='datum of last waarneming in batch')
+    waarneming = models.IntegerField(null=True, blank=True, help_text='primary key of last waarneming in batch')
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return '{} {} {} {}'.format(self.step, self.meetpunt_id or '', self.category, self.batch or '')
+
+    def __str__(self):
+        return self.__unicode__()
+
+class UserSync(models.Model):
+    ''' User account on fixeau.com for a waarnemer '''
+    url = models.CharField(max_length=200, help_text='API url')
+    waarnemer = models.ForeignKey('iom.Waarnemer', on_delete=models.CASCADE)
+    username = models.CharField(max_length=150)
+    user = models.IntegerField(help_text='id of user on fixeau.com')
+    modified = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return '{} -> {}'.format(self.waarnemer, self.username)
+
+    def __str__(self):
+        return self.__unicode__()
+
+    class Meta:
+        unique_together = ('url', 'waarnemer')
@@ -12,11 +12,14 @@ https://docs.djangoproject.com/en/1.8/ref/settings/
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
-import matplotlib
-matplotlib.use('Agg')
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Charts are rendered without a display. The backend is picked up by matplotlib when code that draws charts imports it:
+# MPLBACKEND for matplotlib >= 1.5, older versions read backend from the matplotlibrc file in the MATPLOTLIBRC folder
+os.environ.setdefault('MPLBACKEND', 'Agg')
+os.environ.setdefault('MATPLOTLIBRC', os.path.join(BASE_DIR, 'nzgmeet'))
+
 os.sys.path.append('/home/theo/texelmeet/acaciadata')
 os.sys.path.append('/home/theo/texelmeet/iom')
 
@@ -51,6 +54,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'nzgmeet.middleware.ProfileMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -61,7 +65,7 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.security.SecurityMiddleware',
 )
 
-ROOT_URLCONF = 'iom.urls'
+ROOT_URLCONF = 'nzgmeet.urls'
 
 TEMPLATES = [
     {
@@ -106,10 +110,52 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 PHOTO_URL = os.path.join(MEDIA_URL, 'fotos')
 PHOTO_DIR = os.path.join(MEDIA_ROOT, 'fotos')
+# downscaled copies of photos (nzgmeet.images.Derivatives)
+PHOTO_CACHE_DIR = os.path.join(MEDIA_ROOT, 'cache', 'fotos')
 
 LOGGING_URL = '/logs/'
 LOGGING_ROOT = os.path.join(BASE_DIR, 'logs')
 
+# Cache: redis when REDIS_URL is set (e.g. redis://127.0.0.1:6379/1), local memory of the process otherwise
+REDIS_URL = os.environ.get('REDIS_URL')
+
+# True when all processes share the cache. The backend is chosen from the configuration, not from whether redis
+# can be reached: without a shared cache nzgmeet.cache keeps entries for a short time only
+CACHE_SHARED = bool(REDIS_URL)
+
+if CACHE_SHARED:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'nzgmeet',
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'SOCKET_CONNECT_TIMEOUT': 1,
+                'SOCKET_TIMEOUT': 1,
+                # behave like a cache miss when redis goes away
+                'IGNORE_EXCEPTIONS': True,
+            }
+        }
+    }
+    # sessions are read from the cache and written through to the database
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'nzgmeet',
+            'TIMEOUT': 300,
+        }
+    }
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+# request statistics (nzgmeet.middleware.ProfileMiddleware): number of requests per url pattern kept for percentiles
+# and fraction of requests that is profiled with cProfile (saved in LOGGING_ROOT/profiles)
+PROFILE_WINDOW = 1000
+PROFILE_SAMPLE_RATE = float(os.environ.get('NZGMEET_PROFILE_SAMPLE_RATE', 0))
+
 GRAPPELLI_ADMIN_TITLE='Beheer van NZG Meet'
 
 # registration stuff
@@ -120,30 +166,40 @@ REGISTRATION_AUTO_LOGIN = True
 AUTH_PROFILE_MODULE = 'iom.UserProfile'
 
 # Logging
+# the level of the loggers is set after importing secrets (see LOG_LEVEL below)
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
-        'file': {
-            'level': 'DEBUG',
-            'class': 'logging.handlers.TimedRotatingFileHandler',
-            'filename': os.path.join(LOGGING_ROOT, 'nzgmeet.log'),
-            'when': 'D',
-            'interval': 1, # every day a new file
-            'backupCount': 0,
-            'formatter': 'default'
-        },
         'console': {
             'level': 'DEBUG',
             'class': 'logging.StreamHandler',
         },
-        'django': {
+        # writes to the file handlers in a background thread, so logging does not wait for disk i/o
+        'queue': {
+            '()': 'nzgmeet.logs.QueueHandler',
             'level': 'DEBUG',
-            'class': 'logging.handlers.TimedRotatingFileHandler',
-            'filename': os.path.join(LOGGING_ROOT, 'django.log'),
-            'when': 'D',
-            'interval': 1, # every day a new file
-            'backupCount': 0,
+            'handlers': {
+                'file': {
+                    'level': 'DEBUG',
+                    'class': 'logging.handlers.TimedRotatingFileHandler',
+                    'filename': os.path.join(LOGGING_ROOT, 'nzgmeet.log'),
+                    'when': 'D',
+                    'interval': 1, # every day a new file
+                    'backupCount': 0,
+                    'formatter': 'default',
+                    'filters': ['application'],
+                },
+                'django': {
+                    'level': 'DEBUG',
+                    'class': 'logging.handlers.TimedRotatingFileHandler',
+                    'filename': os.path.join(LOGGING_ROOT, 'django.log'),
+                    'when': 'D',
+                    'interval': 1, # every day a new file
+                    'backupCount': 0,
+                    'filters': ['request'],
+                },
+            },
         },
     },
     'formatters': {
@@ -151,33 +207,44 @@ LOGGING = {
             'format': '%(levelname)s %(asctime)s %(name)s: %(message)s'
         },
     },
+    'filters': {
+        'request': {
+            '()': 'django.utils.log.CallbackFilter',
+            'callback': lambda record: record.name.startswith('django'),
+        },
+        'application': {
+            '()': 'django.utils.log.CallbackFilter',
+            'callback': lambda record: not record.name.startswith('django'),
+        },
+    },
     'loggers': {
         'django.request': {
-            'handlers': ['django'],
-            'level': 'DEBUG',
+            'handlers': ['queue'],
             'propagate': True,
         },
         'iom': {
-            'handlers': ['file',],
-            'level': 'DEBUG',
+            'handlers': ['queue',],
             'propagate': True,
         },
         'iom.management': {
             'handlers': ['console',],
-            'level': 'DEBUG',
             'propagate': True,
         },
         'nzgmeet.management': {
-            'handlers': ['console',],
-            'level': 'DEBUG',
+            'handlers': ['queue','console'],
             'propagate': False,
         },
         'nzgmeet': {
-            'handlers': ['file','console'],
-            'level': 'DEBUG',
+            'handlers': ['queue','console'],
             'propagate': True,
         },
     },
 }
 
 from secrets import *
+
+# level of the nzgmeet, iom and django.request loggers, DEBUG only when debugging unless overridden in the environment.
+# Computed after secrets, which may switch DEBUG off
+LOG_LEVEL = os.environ.get('NZGMEET_LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO')
+for logger in LOGGING['loggers'].values():
+    logger.setdefault('level', LOG_LEVEL)
@@ -0,0 +1,28 @@
+'''
+Template filters for photos of waarnemingen and meetpunten
+'''
+import logging
+
+from django import template
+from django.conf import settings
+
+from nzgmeet.images import Derivatives
+
+logger = logging.getLogger(__name__)
+
+register = template.Library()
+
+# same settings as the export, so pages reuse the derivatives that have been made for the upload
+derivatives = Derivatives()
+
+@register.filter
+def derivative(url):
+    ''' returns url of downscaled copy of the photo at url (foto_url of a waarneming, photo_url of a meetpunt),
+    or url itself when there is no smaller copy: <img src="{{ waarneming.foto_url|derivative }}"> '''
+    if not url:
+        return url
+    try:
+        return derivatives.url(settings.BASE_DIR + url) or url
+    except (IOError, OSError) as error:
+        logger.warning('Photo {} not available: {}'.format(url, error))
+        return url
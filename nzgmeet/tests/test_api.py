@@ -0,0 +1,131 @@
+'''
+Tests of the fixeau.com api client
+'''
+import json
+import time
+import base64
+import threading
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from django.test import SimpleTestCase
+
+from nzgmeet.fixeau.api import Api, retry_policy, token_expiry
+from nzgmeet.fixeau.stub import StubAdapter
+
+def jwt(lifetime):
+    ''' returns unsigned JWT that expires after lifetime seconds '''
+    claims = json.dumps({'username': 'export', 'exp': int(time.time() + lifetime)}).encode('utf-8')
+    return 'header.{}.signature'.format(base64.urlsafe_b64encode(claims).decode('ascii').rstrip('='))
+
+class TokenAdapter(StubAdapter):
+    ''' stub that issues tokens of lifetime seconds and counts the logins '''
+
+    def __init__(self, lifetime):
+        super(TokenAdapter, self).__init__()
+        self.lifetime = lifetime
+        self.logins = 0
+
+    def send(self, request, **kwargs):
+        if request.url.endswith('/token/'):
+            self.logins += 1
+            return self.respond(request, 200, {'token': jwt(self.lifetime)})
+        return super(TokenAdapter, self).send(request, **kwargs)
+
+class TokenTests(SimpleTestCase):
+
+    def api(self, lifetime, refresh=300):
+        adapter = TokenAdapter(lifetime)
+        api = Api('https://fixeau.test/api/v1', transport=adapter, refresh=refresh)
+        api.login('export', 'secret')
+        return api, adapter
+
+    def test_expiry(self):
+        self.assertAlmostEqual(token_expiry(jwt(300)), time.time() + 300, delta=2)
+        self.assertIsNone(token_expiry('dry-run'))
+
+    def test_short_lived(self):
+        # tokens that live no longer than the refresh margin are not renewed before every request
+        api, adapter = self.api(300)
+        for _ in range(10):
+            api.get('/series/').raise_for_status()
+        self.assertEqual(adapter.logins, 1)
+        self.assertAlmostEqual(api.margin, 150, delta=2)
+
+    def test_long_lived(self):
+        api, adapter = self.api(3600)
+        self.assertEqual(api.margin, 300)
+        api.get('/series/')
+        self.assertEqual(adapter.logins, 1)
+
+    def test_renew(self):
+        api, adapter = self.api(300)
+        # halfway the lifetime of the token
+        api.expires = time.time() + 100
+        api.get('/series/')
+        self.assertEqual(adapter.logins, 2)
+        api.get('/series/')
+        self.assertEqual(adapter.logins, 2)
+
+class Server(HTTPServer):
+    ''' local http server that answers every request with the next (status, headers) of responses '''
+
+    def __init__(self, responses):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.responses = list(responses)
+        self.requests = []
+
+class Handler(BaseHTTPRequestHandler):
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.server.requests.append((self.command, self.rfile.read(length)))
+        status, headers = self.server.responses.pop(0)
+        body = b'{}'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = respond
+
+    def log_message(self, *args):
+        pass
+
+class RetryTests(SimpleTestCase):
+
+    def test_policy(self):
+        policy = retry_policy(5, 0.5)
+        # refused requests are retried for every method
+        self.assertTrue(policy.is_retry('POST', 429, False))
+        self.assertTrue(policy.is_retry('POST', 503, True))
+        # the server may have stored a POST that failed with a server error
+        self.assertFalse(policy.is_retry('POST', 503, False))
+        self.assertFalse(policy.is_retry('POST', 502, False))
+        self.assertTrue(policy.is_retry('GET', 502, False))
+
+    def serve(self, responses):
+        server = Server(responses)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, Api('http://127.0.0.1:{}'.format(server.server_port), backoff=0, compress=False)
+
+    def test_post_rate_limited(self):
+        server, api = self.serve([(429, {}), (503, {'Retry-After': '0'}), (201, {})])
+        response = api.post('/measurement/', [{'value': 1.0}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([method for method, body in server.requests], ['POST'] * 3)
+        self.assertEqual(server.requests[0][1], server.requests[2][1])
+
+    def test_post_server_error(self):
+        server, api = self.serve([(502, {}), (201, {})])
+        self.assertEqual(api.post('/measurement/', [{'value': 1.0}]).status_code, 502)
+        self.assertEqual(len(server.requests), 1)
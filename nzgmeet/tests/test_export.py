@@ -0,0 +1,72 @@
+'''
+Tests of helpers of the export2fixeau command
+'''
+import io
+import json
+
+import requests
+from django.test import SimpleTestCase
+
+from nzgmeet.management.commands.export2fixeau import Command, batches
+
+class BatchesTests(SimpleTestCase):
+
+    def test_batches(self):
+        self.assertEqual(list(batches(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_exact(self):
+        self.assertEqual(list(batches(iter(range(6)), 3)), [[0, 1, 2], [3, 4, 5]])
+
+    def test_empty(self):
+        self.assertEqual(list(batches([], 3)), [])
+
+    def test_lazy(self):
+        # batches are yielded while the items are read
+        def items():
+            yield 1
+            yield 2
+            raise AssertionError('read ahead')
+        self.assertEqual(next(batches(items(), 2)), [1, 2])
+
+class Api:
+    ''' api that answers measurement posts with the next status of statuses '''
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.posts = 0
+
+    def send(self, path, body):
+        self.posts += 1
+        status, headers = self.statuses.pop(0)
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = json.dumps({'count': len(json.loads(body))}).encode('utf-8')
+        response.raw = io.BytesIO(response._content)
+        return response
+
+class PostMeasurementsTests(SimpleTestCase):
+
+    def command(self, *statuses):
+        command = Command()
+        command.api = Api(*statuses)
+        command.batch_backoff = 0
+        return command
+
+    def test_refused(self):
+        command = self.command((429, {}), (503, {'Retry-After': '0'}), (201, {}))
+        self.assertEqual(command.postMeasurements('[{}, {}]', 2), 2)
+        self.assertEqual(command.api.posts, 3)
+
+    def test_bounded(self):
+        command = self.command(*[(429, {})] * (Command.batch_retries + 2))
+        with self.assertRaises(requests.HTTPError):
+            command.postMeasurements('[{}]', 1)
+        self.assertEqual(command.api.posts, Command.batch_retries + 1)
+
+    def test_server_error(self):
+        # the server may have stored the batch: not sent again
+        command = self.command((502, {}), (201, {}))
+        with self.assertRaises(requests.HTTPError):
+            command.postMeasurements('[{}]', 1)
+        self.assertEqual(command.api.posts, 1)
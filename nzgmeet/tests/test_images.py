@@ -0,0 +1,88 @@
+'''
+Tests of the downscaled copies of photos
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.test import SimpleTestCase, override_settings
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# EXIF tag of the orientation, 6: rotate 90 degrees clockwise to display
+ORIENTATION = 0x0112
+
+@unittest.skipIf(Image is None or not hasattr(Image, 'Exif'), 'Pillow >= 6 is not installed')
+class DerivativesTests(SimpleTestCase):
+
+    def setUp(self):
+        from nzgmeet.images import Derivatives
+        self.folder = tempfile.mkdtemp()
+        self.derivatives = Derivatives(os.path.join(self.folder, 'cache'), max_size=100, quality=80)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def photo(self, name, size, orientation=None, quality=95):
+        ''' saves a noisy jpeg of size (width, height) with EXIF orientation, returns its file name '''
+        path = os.path.join(self.folder, name)
+        image = Image.effect_noise(size, 64).convert('RGB')
+        exif = Image.Exif()
+        if orientation:
+            exif[ORIENTATION] = orientation
+        image.save(path, 'JPEG', quality=quality, optimize=True, exif=exif.tobytes())
+        return path
+
+    def test_rotated(self):
+        source = self.photo('portrait.jpg', (400, 200), orientation=6)
+        sha1 = self.derivatives.hash(source)
+        target = self.derivatives.get(source, sha1)
+        self.assertEqual(target, os.path.join(self.folder, 'cache', '100-q80', sha1[:2], sha1 + '.jpg'))
+        derivative = Image.open(target)
+        # rotated to portrait, metadata left out
+        self.assertEqual(derivative.size, (50, 100))
+        self.assertNotIn(ORIENTATION, derivative.getexif())
+        derivative.close()
+        self.assertLess(os.path.getsize(target), os.path.getsize(source))
+        # made only once
+        mtime = os.path.getmtime(target)
+        self.assertEqual(self.derivatives.get(source, sha1), target)
+        self.assertEqual(os.path.getmtime(target), mtime)
+
+    def test_small(self):
+        # a derivative of better quality is larger than the source
+        source = self.photo('small.jpg', (20, 10), quality=20)
+        sha1 = self.derivatives.hash(source)
+        self.assertEqual(self.derivatives.get(source, sha1), source)
+        # the decision is remembered with an empty file
+        self.assertEqual(os.path.getsize(self.derivatives.path(sha1)), 0)
+        self.assertEqual(self.derivatives.get(source, sha1), source)
+        self.assertEqual([name for name in os.listdir(os.path.dirname(self.derivatives.path(sha1))) if name.startswith('tmp')], [])
+
+    def test_settings(self):
+        from nzgmeet.images import Derivatives
+        source = self.photo('portrait.jpg', (400, 200))
+        sha1 = self.derivatives.hash(source)
+        other = Derivatives(self.derivatives.folder, max_size=50, quality=60)
+        self.assertNotEqual(self.derivatives.path(sha1), other.path(sha1))
+        derivative = Image.open(other.get(source, sha1))
+        self.assertEqual(derivative.size, (50, 25))
+        derivative.close()
+
+    def test_invalid(self):
+        source = os.path.join(self.folder, 'invalid.jpg')
+        with open(source, 'wb') as f:
+            f.write(b'no jpeg')
+        self.assertEqual(self.derivatives.get(source, self.derivatives.hash(source)), source)
+
+    def test_url(self):
+        source = self.photo('portrait.jpg', (400, 200), orientation=6)
+        sha1 = self.derivatives.hash(source)
+        with override_settings(MEDIA_ROOT=self.folder, MEDIA_URL='/media/'):
+            self.assertEqual(self.derivatives.url(source), '/media/cache/100-q80/{}/{}.jpg'.format(sha1[:2], sha1))
+            small = self.photo('small.jpg', (20, 10), quality=20)
+            self.assertIsNone(self.derivatives.url(small))
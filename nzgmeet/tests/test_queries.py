@@ -0,0 +1,79 @@
+'''
+Tests of the selection of waarnemingen for the fixeau.com export
+'''
+from collections import namedtuple
+from datetime import datetime
+
+from django.test import SimpleTestCase
+
+from nzgmeet.fixeau.queries import ExportQuery, Row
+
+# the fields of SeriesSync and ExportStep that are used as marks
+Mark = namedtuple('Mark', ['datum', 'waarneming'])
+
+def row(datum, pk, meetpunt=1, naam='ec'):
+    return Row(meetpunt, naam, datum, pk, 1.0, None)
+
+class ExportQueryTests(SimpleTestCase):
+
+    def setUp(self):
+        # rows of a resampled series are ordered by datum, rows of a raw series by pk
+        self.rows = [row(datetime(2020, 1, day), pk) for day, pk in ((1, 10), (2, 11), (2, 30), (3, 12), (4, 13))]
+        self.raw = sorted(self.rows, key=lambda r: r.pk)
+
+    def pks(self, rows):
+        return [r.pk for r in rows]
+
+    def test_marks(self):
+        syncs = {(1, ''): Mark(datetime(2020, 1, 3), 12), (2, ''): Mark(None, None)}
+        query = ExportQuery(syncs)
+        self.assertEqual(query.mark(1, ''), 12)
+        self.assertIsNone(query.mark(1, 'Deep'))
+        self.assertIsNone(query.mark(2, ''))
+        self.assertEqual(ExportQuery(syncs, resampled=True).mark(1, ''), (datetime(2020, 1, 3), 12))
+        self.assertIsNone(ExportQuery(syncs, full=True).mark(1, ''))
+
+    def test_position(self):
+        positions = {(1, ''): Mark(datetime(2020, 1, 2), 11)}
+        query = ExportQuery(positions=positions)
+        self.assertEqual(query.position(1, ''), 11)
+        self.assertIsNone(query.position(1, 'Deep'))
+        self.assertEqual(ExportQuery(positions=positions, resampled=True).position(1, ''), (datetime(2020, 1, 2), 11))
+
+    def test_after_unmarked(self):
+        query = ExportQuery()
+        self.assertEqual(self.pks(query.after(self.raw, None)), [10, 11, 12, 13, 30])
+
+    def test_after_pk(self):
+        # raw series: a waarneming imported later with an older datum (pk 30) is exported
+        query = ExportQuery({(1, ''): Mark(datetime(2020, 1, 4), 13)})
+        self.assertEqual(self.pks(query.after(self.raw, query.mark(1, ''))), [30])
+        query = ExportQuery({(1, ''): Mark(datetime(2020, 1, 2), 11)})
+        self.assertEqual(self.pks(query.after(self.raw, query.mark(1, ''))), [12, 13, 30])
+
+    def test_after_resampled(self):
+        # resampled series: sent intervals can not be amended, rows up to (datum, pk) of the mark are skipped
+        query = ExportQuery({(1, ''): Mark(datetime(2020, 1, 2), 11)}, resampled=True)
+        self.assertEqual(self.pks(query.after(self.rows, query.mark(1, ''))), [30, 12, 13])
+        query = ExportQuery({(1, ''): Mark(datetime(2020, 1, 3), 12)}, resampled=True)
+        self.assertEqual(self.pks(query.after(self.rows, query.mark(1, ''))), [13])
+
+    def test_after_position(self):
+        # an interrupted run continues after its last batch, rows below the mark are skipped as well
+        query = ExportQuery({(1, ''): Mark(datetime(2020, 1, 1), 10)},
+                            positions={(1, ''): Mark(datetime(2020, 1, 3), 12)})
+        self.assertEqual(self.pks(query.after(self.raw, query.mark(1, ''), query.position(1, ''))), [13, 30])
+        query = ExportQuery({(1, ''): Mark(datetime(2020, 1, 1), 10)},
+                            positions={(1, ''): Mark(datetime(2020, 1, 2), 30)}, resampled=True)
+        self.assertEqual(self.pks(query.after(self.rows, query.mark(1, ''), query.position(1, ''))), [12, 13])
+
+    def test_since(self):
+        self.assertIn('pk__gt', str(ExportQuery().since(12)))
+        self.assertIn('datum__gte', str(ExportQuery(resampled=True).since(datetime(2020, 1, 1))))
+
+    def test_series(self):
+        rows = [row(datetime(2020, 1, 1), 1, naam='ec_ondiep'), row(datetime(2020, 1, 2), 2, naam='ec_ondiep'),
+                row(datetime(2020, 1, 1), 3, naam='ec_diep')]
+        query = ExportQuery({(1, 'Shallow'): Mark(datetime(2020, 1, 1), 1)})
+        series = [(category, self.pks(rows)) for category, rows in query.series(1, iter(rows))]
+        self.assertEqual(series, [('Shallow', [2]), ('Deep', [3])])
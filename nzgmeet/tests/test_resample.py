@@ -0,0 +1,70 @@
+'''
+Tests of the downsampling of EC series
+'''
+from datetime import datetime, timedelta
+
+from django.test import SimpleTestCase
+from django.utils.timezone import utc
+
+from nzgmeet.fixeau.queries import Row
+from nzgmeet.fixeau.resample import resample, label
+
+def rows(start, count, step=timedelta(minutes=15), waarde=1.0):
+    return [Row(1, 'ec', start + index * step, index + 1, waarde + index, None) for index in range(count)]
+
+class ResampleTests(SimpleTestCase):
+
+    def test_label(self):
+        self.assertEqual(label('1H', 'mean'), '1H mean')
+
+    def test_hourly(self):
+        # 2 complete hours and the current hour
+        data = rows(datetime(2020, 1, 1), 10)
+        buckets = list(resample(data, '1H', 'mean', now=datetime(2020, 1, 1, 2, 30)))
+        self.assertEqual([bucket.datum for bucket in buckets], [datetime(2020, 1, 1, 0), datetime(2020, 1, 1, 1)])
+        self.assertEqual([bucket.waarde for bucket in buckets], [2.5, 6.5])
+        # the last waarneming of an interval is the high-water mark
+        self.assertEqual([bucket.last.pk for bucket in buckets], [4, 8])
+
+    def test_hold_back(self):
+        data = rows(datetime(2020, 1, 1), 10)
+        # the interval of the last row has ended
+        buckets = list(resample(data, '1H', 'max', now=datetime(2020, 1, 1, 3)))
+        self.assertEqual([bucket.waarde for bucket in buckets], [4.0, 8.0, 10.0])
+        # nothing has ended
+        self.assertEqual(list(resample(data[:2], '1H', 'max', now=datetime(2020, 1, 1, 0, 45))), [])
+
+    def test_chunks(self):
+        data = rows(datetime(2020, 1, 1), 24 * 4)
+        expected = list(resample(data, '1H', 'last', now=datetime(2020, 1, 2)))
+        self.assertEqual(len(expected), 24)
+        # intervals that span chunks, chunks within one interval
+        for chunk_size in (1, 3, 4, 7, 1000):
+            self.assertEqual(list(resample(iter(data), '1H', 'last', now=datetime(2020, 1, 2), chunk_size=chunk_size)),
+                             expected, 'chunk size {}'.format(chunk_size))
+
+    def test_daily_normalized(self):
+        data = rows(datetime(2020, 1, 1), 3, step=timedelta(hours=12), waarde=1000.0)
+        buckets = list(resample(data, '1D', 'min', now=datetime(2020, 1, 5)))
+        self.assertEqual([(bucket.datum, bucket.waarde) for bucket in buckets],
+                         [(datetime(2020, 1, 1), 1.0), (datetime(2020, 1, 2), 1.002)])
+
+    def test_local_midnight(self):
+        # 23:00 and 23:30 UTC are on different days in Amsterdam, a day starts at 23:00 UTC in winter
+        data = [Row(1, 'ec', datetime(2020, 1, 1, hour, minute, tzinfo=utc), pk, 1.0, None)
+                for pk, (hour, minute) in enumerate(((12, 0), (22, 30), (23, 30)), 1)]
+        buckets = list(resample(data, '1D', 'last', now=datetime(2020, 1, 5, tzinfo=utc), tz='Europe/Amsterdam'))
+        self.assertEqual([bucket.datum for bucket in buckets],
+                         [datetime(2019, 12, 31, 23, tzinfo=utc), datetime(2020, 1, 1, 23, tzinfo=utc)])
+        self.assertEqual([bucket.last.pk for bucket in buckets], [2, 3])
+
+    def test_daylight_saving(self):
+        # the hour from 2:00 to 3:00 is repeated when summer time ends
+        data = [Row(1, 'ec', datetime(2020, 10, 25, 0, minute, tzinfo=utc) + timedelta(hours=hour), pk, 1.0, None)
+                for pk, (hour, minute) in enumerate(((0, 30), (1, 30), (2, 30)), 1)]
+        buckets = list(resample(data, '1H', 'last', now=datetime(2020, 10, 26, tzinfo=utc), tz='Europe/Amsterdam'))
+        self.assertEqual([bucket.datum for bucket in buckets],
+                         [datetime(2020, 10, 25, hour, tzinfo=utc) for hour in range(3)])
+
+    def test_empty(self):
+        self.assertEqual(list(resample([], '1H', 'mean')), [])
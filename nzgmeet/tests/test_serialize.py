@@ -0,0 +1,65 @@
+'''
+Tests of the serialization of measurements for fixeau.com
+'''
+import json
+from datetime import datetime, timedelta, tzinfo
+
+from django.test import SimpleTestCase
+
+from nzgmeet.fixeau.serialize import measurements, normalize
+
+class Offset(tzinfo):
+    ''' fixed offset in hours from UTC '''
+
+    def __init__(self, hours):
+        self.offset = timedelta(hours=hours)
+
+    def utcoffset(self, dt):
+        return self.offset
+
+    def dst(self, dt):
+        return timedelta(0)
+
+GEOMETRY = {'type': 'Point', 'coordinates': [4.8, 53.05]}
+
+class SerializeTests(SimpleTestCase):
+
+    def serialize(self, dates, values, **kwargs):
+        return json.loads(measurements(dates, values, GEOMETRY, 'device-1', 12, **kwargs))
+
+    def test_empty(self):
+        self.assertEqual(measurements([], [], GEOMETRY, 'device-1', 12), '[]')
+
+    def test_fields(self):
+        items = self.serialize([datetime(2020, 1, 2, 3, 4, 5)], [1.5], meta=[{'image_id': 7}])
+        self.assertEqual(items, [{'time': '2020-01-02T03:04:05', 'value': 1.5, 'meta': {'image_id': 7},
+                                  'location': GEOMETRY, 'source': 'device-1', 'parameter': 'EC',
+                                  'unit': 'mS/cm', 'series': 12}])
+
+    def test_normalize(self):
+        # EC above 50 is in uS/cm
+        self.assertEqual(normalize([1.2, 1200]).tolist(), [1.2, 1.2])
+        items = self.serialize([datetime(2020, 1, 1)] * 2, [1.2, 1200])
+        self.assertEqual([item['value'] for item in items], [1.2, 1.2])
+        items = self.serialize([datetime(2020, 1, 1)], [1200], convert=False)
+        self.assertEqual(items[0]['value'], 1200)
+
+    def test_not_finite(self):
+        dates = [datetime(2020, 1, 1, hour) for hour in range(4)]
+        text = measurements(dates, [float('nan'), float('inf'), float('-inf'), 2.0], GEOMETRY, 'device-1', 12)
+        # strict json: no NaN or Infinity
+        items = json.loads(text, parse_constant=lambda name: self.fail('{} in json'.format(name)))
+        self.assertEqual([item['value'] for item in items], [None, None, None, 2.0])
+
+    def test_timezone(self):
+        dates = [datetime(2020, 6, 1, 14, 0, tzinfo=Offset(2)), datetime(2020, 6, 1, 12, 30, 0, 500, tzinfo=Offset(0))]
+        items = self.serialize(dates, [1.0, 2.0])
+        # converted to UTC, microseconds only when there are any
+        self.assertEqual([item['time'] for item in items],
+                         ['2020-06-01T12:00:00.000000+00:00', '2020-06-01T12:30:00.000500+00:00'])
+        items = self.serialize([datetime(2020, 6, 1, 14, 0, tzinfo=Offset(2))], [1.0])
+        self.assertEqual(items[0]['time'], '2020-06-01T12:00:00+00:00')
+
+    def test_naive(self):
+        items = self.serialize([datetime(2020, 6, 1, 14, 0)], [1.0])
+        self.assertEqual(items[0]['time'], '2020-06-01T14:00:00')
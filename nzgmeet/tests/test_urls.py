@@ -0,0 +1,74 @@
+'''
+Request level tests of the routes in nzgmeet.urls
+'''
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import resolve, reverse
+from django.test import TestCase
+
+from nzgmeet import views
+
+class UrlTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'secret', is_staff=True)
+        self.client.login(username='staff', password='secret')
+
+    def assertNotModified(self, path):
+        ''' fetch path and fetch it again with the ETag of the first response, returns the first response '''
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('ETag'))
+        again = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        return response
+
+    def test_resolve(self):
+        self.assertEqual(resolve('/download/waarnemingen.csv').func, views.download)
+        self.assertEqual(resolve('/download/waarnemingen.ndjson').func, views.download)
+        self.assertEqual(resolve('/profile/').func, views.profile)
+        self.assertEqual(resolve('/meetpunten.geojson').func, views.meetpunten)
+
+    def test_download_csv(self):
+        path = reverse('download-waarnemingen', kwargs={'format': 'csv'})
+        response = self.assertNotModified(path)
+        self.assertEqual(response['Content-Type'], views.CONTENT_TYPES['csv'])
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(content.splitlines(), [','.join(views.FIELDS)])
+
+    def test_download_ndjson(self):
+        path = reverse('download-waarnemingen', kwargs={'format': 'ndjson'})
+        response = self.assertNotModified(path)
+        self.assertEqual(response['Content-Type'], views.CONTENT_TYPES['ndjson'])
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    def test_download_modified(self):
+        path = reverse('download-waarnemingen', kwargs={'format': 'csv'})
+        response = self.client.get(path)
+        self.assertTrue(response.has_header('Last-Modified'))
+        again = self.client.get(path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_download_invalid(self):
+        path = reverse('download-waarnemingen', kwargs={'format': 'csv'})
+        self.assertEqual(self.client.get(path, {'start': 'yesterday'}).status_code, 400)
+
+    def test_download_login(self):
+        self.client.logout()
+        path = reverse('download-waarnemingen', kwargs={'format': 'csv'})
+        self.assertEqual(self.client.get(path).status_code, 302)
+
+    def test_profile(self):
+        self.client.get(reverse('meetpunten-geojson'))
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('patterns', json.loads(response.content.decode('utf-8')))
+
+    def test_meetpunten(self):
+        response = self.assertNotModified(reverse('meetpunten-geojson'))
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {'type': 'FeatureCollection', 'features': []})
+        response = self.assertNotModified(reverse('meetpunten-geojson') + '?bbox=4,51,5,52')
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['features'], [])
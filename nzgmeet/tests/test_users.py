@@ -0,0 +1,32 @@
+'''
+Tests of the username assignment for fixeau.com accounts
+'''
+from django.test import SimpleTestCase
+
+from nzgmeet.fixeau.users import basename, assign_usernames
+
+class UsernameTests(SimpleTestCase):
+
+    def test_basename(self):
+        self.assertEqual(basename('Jan de Vries'), 'jandevries')
+
+    def test_new(self):
+        self.assertEqual(assign_usernames(['Jan de Vries'], set(), set()), [('Jan de Vries', 'jandevries', False)])
+
+    def test_existing(self):
+        # an unclaimed account with the preferred name belongs to the waarnemer
+        self.assertEqual(assign_usernames(['Jan de Vries'], {'jandevries'}, set()), [('Jan de Vries', 'jandevries', True)])
+
+    def test_claimed(self):
+        result = assign_usernames(['Jan de Vries'], {'jandevries', 'jandevries1'}, {'jandevries'})
+        self.assertEqual(result, [('Jan de Vries', 'jandevries2', False)])
+
+    def test_same_name(self):
+        # waarnemers of one run claim their usernames too
+        result = assign_usernames(['Jan de Vries', 'Jan de vries', 'jan devries'], set(), set())
+        self.assertEqual([username for waarnemer, username, exists in result], ['jandevries', 'jandevries1', 'jandevries2'])
+
+    def test_claimed_not_changed(self):
+        claimed = {'piet'}
+        assign_usernames(['Piet'], set(), claimed)
+        self.assertEqual(claimed, {'piet'})
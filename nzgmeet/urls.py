@@ -14,8 +14,13 @@ Including another URLconf
     2. Add a URL to urlpatterns:  url(r'^blog/', include(blog_urls))
 """
 from django.conf.urls import include, url
-from django.contrib import admin
 
+from nzgmeet import views
+
+# routes of nzgmeet come first, everything else (admin included) is served by iom
 urlpatterns = [
-    url(r'^admin/', include(admin.site.urls)),
+    url(r'^profile/$', views.profile, name='profile'),
+    url(r'^meetpunten\.geojson$', views.meetpunten, name='meetpunten-geojson'),
+    url(r'^download/waarnemingen\.(?P<format>csv|ndjson)$', views.download, name='download-waarnemingen'),
+    url(r'^', include('iom.urls')),
 ]
@@ -0,0 +1,201 @@
+'''
+Bulk download of waarnemingen
+'''
+import csv
+import json
+import hashlib
+from datetime import datetime, time
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import BigIntegerField, Count, Max, Sum
+from django.db.models.expressions import RawSQL
+from django.http import StreamingHttpResponse, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import condition, require_GET
+
+from iom.models import Waarneming
+from nzgmeet import geojson
+from nzgmeet.middleware import statistics
+
+# columns of a download
+FIELDS = ('meetpunt', 'naam', 'datum', 'waarde', 'device')
+COLUMNS = ('locatie_id', 'naam', 'datum', 'waarde', 'device')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# size of the pieces of a streamed response in characters
+CHUNK_SIZE = 1 << 16
+
+# seconds that the time a version of a download was first served is remembered, Last-Modified is now after that
+MODIFIED_TIMEOUT = 7 * 24 * 3600
+
+def parse_moment(value, end=False):
+    ''' returns datetime for an iso date or datetime string. A date without time means the start of the day,
+    or the end of the day when end is True. Raises ValueError when value is not a valid date '''
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError('Invalid date: {}'.format(value))
+        moment = datetime.combine(day, time.max if end else time.min)
+    if settings.USE_TZ and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+def selection(request):
+    ''' returns queryset of the waarnemingen selected by the query parameters of request:
+    meetpunt (id, repeatable), parameter (naam of waarneming, repeatable), start and end (iso date or datetime).
+    The result is cached on the request, so conditional processing and the response share one queryset '''
+    queryset = getattr(request, '_waarnemingen', None)
+    if queryset is None:
+        queryset = Waarneming.objects.all()
+        meetpunten = request.GET.getlist('meetpunt')
+        if meetpunten:
+            queryset = queryset.filter(locatie__in=[int(pk) for pk in meetpunten])
+        parameters = request.GET.getlist('parameter')
+        if parameters:
+            queryset = queryset.filter(naam__in=parameters)
+        start = request.GET.get('start')
+        if start:
+            queryset = queryset.filter(datum__gte=parse_moment(start))
+        end = request.GET.get('end')
+        if end:
+            queryset = queryset.filter(datum__lte=parse_moment(end, True))
+        request._waarnemingen = queryset
+    return queryset
+
+def summary(request):
+    ''' returns number of rows, highest primary key, last datum and version of the selection (one aggregate query per request).
+    The version changes when a selected row is changed: the id of the last transaction that inserted or updated a row
+    on PostgreSQL, the sum of the values on other databases '''
+    stats = getattr(request, '_summary', None)
+    if stats is None:
+        if connection.vendor == 'postgresql':
+            version = Max(RawSQL('{}.xmin::text::bigint'.format(connection.ops.quote_name(Waarneming._meta.db_table)), (),
+                                 output_field=BigIntegerField()))
+        else:
+            version = Sum('waarde')
+        try:
+            stats = selection(request).aggregate(count=Count('pk'), last=Max('pk'), datum=Max('datum'), version=version)
+        except ValueError:
+            # invalid query parameters are reported by the view
+            stats = {}
+        request._summary = stats
+    return stats
+
+def etag(request, format):
+    stats = summary(request)
+    if not stats:
+        return None
+    return '{}-{}-{}-{}'.format(format, stats['count'], stats['last'] or 0, stats['version'] or 0)
+
+def last_modified(request, format):
+    ''' returns the time this version of the selection (see etag) was first served. A waarneming added later
+    with an older datum or a changed value gives a new version and so a later Last-Modified '''
+    tag = etag(request, format)
+    if tag is None:
+        return None
+    key = 'nzgmeet:download:' + hashlib.md5('{}?{}'.format(tag, request.GET.urlencode()).encode('utf-8')).hexdigest()
+    # add() keeps the time of the first request of this version
+    cache.add(key, timezone.now().replace(microsecond=0), MODIFIED_TIMEOUT)
+    return cache.get(key) or timezone.now()
+
+def chunked(lines):
+    ''' join lines into pieces of about CHUNK_SIZE characters, every piece is a single write of the server '''
+    buf = []
+    size = 0
+    for line in lines:
+        buf.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield ''.join(buf)
+
+class Echo:
+    ''' file-like object for csv.writer that returns the written line instead of buffering it '''
+    def write(self, value):
+        return value
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(FIELDS, row))) + '\n'
+
+@require_GET
+@login_required
+@condition(etag_func=etag, last_modified_func=last_modified)
+def download(request, format):
+    ''' stream waarnemingen as csv or ndjson, ordered by meetpunt, naam and datum.
+    Rows are read from a server side cursor and written as they come, memory use does not depend on the number of rows.
+    Responses carry ETag and Last-Modified headers, unchanged selections are answered with 304 Not Modified '''
+    try:
+        queryset = selection(request)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    rows = queryset.order_by('locatie', 'naam', 'datum', 'pk').values_list(*COLUMNS).iterator()
+    lines = csv_lines(rows) if format == 'csv' else ndjson_lines(rows)
+    response = StreamingHttpResponse(chunked(lines), content_type=CONTENT_TYPES[format])
+    response['Content-Disposition'] = 'attachment; filename="waarnemingen.{}"'.format(format)
+    return response
+
+@require_GET
+@staff_member_required
+def profile(request):
+    ''' rolling request statistics per url pattern collected by ProfileMiddleware (times in seconds) '''
+    return JsonResponse({'window': statistics.window, 'patterns': statistics.summary()})
+
+def parse_bbox(request):
+    ''' returns (xmin, ymin, xmax, ymax) of query parameter bbox or None. Raises ValueError when bbox is invalid '''
+    bbox = request.GET.get('bbox')
+    if not bbox:
+        return None
+    bbox = tuple(float(value) for value in bbox.split(','))
+    if len(bbox) != 4:
+        raise ValueError('bbox needs 4 values: xmin,ymin,xmax,ymax')
+    return bbox
+
+def layer(request):
+    ''' returns the cached layer, read once per request for conditional processing and the response '''
+    result = getattr(request, '_layer', None)
+    if result is None:
+        result = request._layer = geojson.get_layer()
+    return result
+
+def layer_etag(request):
+    return '{}-{}'.format(layer(request)['etag'], request.GET.get('bbox', ''))
+
+@require_GET
+@condition(etag_func=layer_etag)
+def meetpunten(request):
+    ''' GeoJSON FeatureCollection of the meetpunten (WGS84) with latest EC value, optionally within bbox=xmin,ymin,xmax,ymax.
+    The layer is built once and served from the cache until a meetpunt or waarneming changes '''
+    try:
+        bbox = parse_bbox(request)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    if bbox is None:
+        content = layer(request)['json']
+    else:
+        content = json.dumps(geojson.get_collection(bbox, layer(request)), separators=(',', ':'))
+    response = HttpResponse(content, content_type='application/geo+json')
+    patch_cache_control(response, public=True, max_age=300)
+    return response